@@ -0,0 +1,292 @@
+"""Нагрузочный прогон обработчиков бота на синтетических обновлениях.
+
+Application собирается через bot.build_application, как в однопроцессном режиме:
+ограничитель OutboundSender, SqlitePersistence, параллельная обработка, outbox,
+уборка и метрики по config.py. Подменяется только клиент Bot API - запросы уходят
+в локальную заглушку, а обновления подаются напрямую, без getUpdates и webhook.
+Данные создаются во временном каталоге, рабочие файлы проекта не затрагиваются.
+
+С лимитами Telegram (около 30 сообщений в секунду) прогон измеряет в основном их;
+--no-rate-limit снимает лимиты ограничителя, чтобы измерить сами обработчики
+(повторы, склейка запросов и кэш показанного остаются).
+
+    python benchmarks/load.py --users 50 --rounds 3 --catalog 500 --orders 10000 --no-rate-limit
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from telegram import Update
+from telegram.request import BaseRequest
+
+import bot
+from config import ADMIN_ID, CONCURRENT_UPDATES
+from handlers.router import encode
+from services import sender
+
+# Ёмкость и скорость ведер ограничителя при --no-rate-limit
+UNLIMITED = 1e9
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+
+
+class StubRequest(BaseRequest):
+    """Локальная заглушка Bot API: отвечает фиксированными данными с заданной задержкой"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self._message_ids = itertools.count(1)
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        endpoint = url.rsplit('/', 1)[1]
+        self.calls[endpoint] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        params = request_data.parameters if request_data else {}
+        if endpoint == "getMe":
+            result = BOT_USER
+        elif endpoint == "sendMediaGroup":
+            result = [self._message(params) for _ in params.get("media", [])]
+        elif endpoint.startswith(("send", "edit")):
+            result = self._message(params)
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode('utf-8')
+
+    def _message(self, params: dict) -> dict:
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": int(params.get("chat_id") or 1), "type": "private"},
+            "from": BOT_USER,
+            "text": params.get("text", "")
+        }
+
+
+class UpdateFactory:
+    """Создаёт синтетические Update в формате Bot API"""
+
+    def __init__(self, bot_instance):
+        self.bot = bot_instance
+        self._ids = itertools.count(1)
+
+    def _user(self, user_id: int) -> dict:
+        return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "username": f"user{user_id}"}
+
+    def _message(self, user_id: int, **fields) -> dict:
+        return {
+            "message_id": next(self._ids),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": self._user(user_id),
+            **fields
+        }
+
+    def command(self, user_id: int, command: str) -> Update:
+        """command - команда без "/", можно с аргументами: search приказ"""
+        text = f"/{command}"
+        length = len(text.split()[0])
+        message = self._message(user_id, text=text, entities=[{"type": "bot_command", "offset": 0, "length": length}])
+        return Update.de_json({"update_id": next(self._ids), "message": message}, self.bot)
+
+    def callback(self, user_id: int, data: str) -> Update:
+        query = {
+            "id": str(next(self._ids)),
+            "from": self._user(user_id),
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": self._message(user_id, text="...", **{"from": BOT_USER})
+        }
+        return Update.de_json({"update_id": next(self._ids), "callback_query": query}, self.bot)
+
+    def inline(self, user_id: int, text: str) -> Update:
+        query = {"id": str(next(self._ids)), "from": self._user(user_id), "query": text, "offset": ""}
+        return Update.de_json({"update_id": next(self._ids), "inline_query": query}, self.bot)
+
+    def receipt(self, user_id: int) -> Update:
+        n = next(self._ids)
+        photo = [{"file_id": f"receipt_{user_id}_{n}", "file_unique_id": f"r{user_id}_{n}", "width": 100, "height": 100}]
+        return Update.de_json({"update_id": next(self._ids), "message": self._message(user_id, photo=photo)}, self.bot)
+
+
+def generate_data(directory: str, catalog_size: int, categories: int, orders: int) -> list:
+    """Пишет синтетический каталог и историю заказов; возвращает список (категория, товар)"""
+    os.makedirs(os.path.join(directory, 'data'), exist_ok=True)
+    items = []
+    products = {"categories": []}
+    for c in range(categories):
+        category = {"id": f"cat_{c}", "name": f"Категория {c}", "items": []}
+        products["categories"].append(category)
+    for i in range(catalog_size):
+        category = products["categories"][i % categories]
+        item = {"id": f"item_{i}", "name": f"Приказ №{i}", "price": 100 + i % 500, "file_id": f"file_{i}"}
+        category["items"].append(item)
+        items.append((category["id"], item["id"]))
+    with open(os.path.join(directory, 'data', 'products.json'), 'w', encoding='utf-8') as f:
+        json.dump(products, f, ensure_ascii=False)
+
+    from storage import db, orders as order_store
+    conn = db.get_connection()
+    order_store.migrate_from_json()
+    rows = [
+        (1000000 + n % 5000, f"user{n}", "2025-01-01 00:00",
+         json.dumps([{"id": "item_0", "name": "Приказ №0", "price": 100, "quantity": 1}]),
+         100, random.choice(("pending", "paid", "delivered")), "receipt")
+        for n in range(orders)
+    ]
+    with conn:
+        conn.executemany(
+            "INSERT INTO orders (user_id, username, date, items, total, status, receipt_file_id) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+        )
+    return items
+
+
+def user_script(factory: UpdateFactory, user_id: int, items: list) -> list:
+    """Типичный путь покупателя: (метка обработчика, обновление)"""
+    category_id, item_id = random.choice(items)
+    return [
+        ("start", factory.command(user_id, "start")),
+        ("catalog.show_categories", factory.callback(user_id, encode("catalog"))),
+        ("catalog.show_items", factory.callback(user_id, encode("category", category_id))),
+        ("catalog.item_details", factory.callback(user_id, encode("item", item_id))),
+        ("cart.add_to_cart", factory.callback(user_id, encode("add", item_id))),
+        ("cart.view_cart", factory.callback(user_id, encode("view_cart"))),
+        ("payments.checkout", factory.callback(user_id, encode("checkout"))),
+        ("payments.confirm_payment", factory.callback(user_id, encode("confirm_payment"))),
+        ("payments.handle_receipt", factory.receipt(user_id)),
+    ]
+
+
+def admin_script(factory: UpdateFactory) -> list:
+    return [
+        ("admin.admin_start", factory.command(ADMIN_ID, "admin")),
+        ("admin.admin_view_orders", factory.callback(ADMIN_ID, encode("admin_view_orders"))),
+        ("admin.admin_orders_page", factory.callback(ADMIN_ID, encode("orders", "all", "older", 0))),
+        ("admin.admin_remove_product", factory.callback(ADMIN_ID, encode("admin_remove_product"))),
+    ]
+
+
+async def run(args) -> dict:
+    items = generate_data(os.getcwd(), args.catalog, args.categories, args.orders)
+    request = StubRequest(latency=args.api_latency / 1000)
+    if args.no_rate_limit:
+        for name in ("GLOBAL_RATE", "GLOBAL_BURST", "CHAT_RATE", "CHAT_BURST", "GROUP_RATE", "GROUP_BURST"):
+            setattr(sender, name, UNLIMITED)
+    bot.CONCURRENT_UPDATES = args.concurrency
+    application = bot.build_application(request=request)
+    factory = UpdateFactory(application.bot)
+    latencies = defaultdict(list)
+
+    async def process(label: str, update: Update) -> None:
+        started = time.perf_counter()
+        await application.update_processor.process_update(update, application.process_update(update))
+        latencies[label].append(time.perf_counter() - started)
+
+    async def customer(user_id: int) -> None:
+        for _ in range(args.rounds):
+            for label, update in user_script(factory, user_id, items):
+                await process(label, update)
+
+    async def administrator() -> None:
+        for _ in range(args.rounds):
+            for label, update in admin_script(factory):
+                await process(label, update)
+
+    # Как в рабочем процессе (services.cluster.serve), только обновления подаются напрямую
+    async with application:
+        await application.post_init(application)
+        await application.start()
+        started = time.perf_counter()
+        await asyncio.gather(
+            administrator(),
+            *(customer(2000000 + n) for n in range(args.users))
+        )
+        elapsed = time.perf_counter() - started
+        await application.stop()
+    await application.post_shutdown(application)
+
+    return {"elapsed": elapsed, "latencies": latencies, "api_calls": dict(request.calls)}
+
+
+def percentile(values: list, q: float) -> float:
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[int(q) - 1]
+
+
+def report(result: dict) -> str:
+    lines = [f"{'обработчик':<28}{'вызовов':>9}{'p50, мс':>10}{'p99, мс':>10}{'в сек':>10}"]
+    total = 0
+    for label, values in sorted(result["latencies"].items()):
+        total += len(values)
+        lines.append(
+            f"{label:<28}{len(values):>9}"
+            f"{percentile(values, 50) * 1000:>10.2f}{percentile(values, 99) * 1000:>10.2f}"
+            f"{len(values) / result['elapsed']:>10.1f}"
+        )
+    lines.append("")
+    lines.append(f"Всего обновлений: {total} за {result['elapsed']:.2f} с ({total / result['elapsed']:.1f} в сек)")
+    lines.append("Вызовы Bot API: " + ", ".join(f"{k}={v}" for k, v in sorted(result["api_calls"].items())))
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=20, help="одновременных покупателей")
+    parser.add_argument("--rounds", type=int, default=3, help="проходов сценария на покупателя")
+    parser.add_argument("--catalog", type=int, default=200, help="товаров в каталоге")
+    parser.add_argument("--categories", type=int, default=10, help="категорий в каталоге")
+    parser.add_argument("--orders", type=int, default=1000, help="заказов в истории")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENT_UPDATES, help="лимит параллельных обновлений (1 - последовательно)")
+    parser.add_argument("--no-rate-limit", action="store_true", help="снять лимиты Telegram в OutboundSender")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="задержка ответа заглушки Bot API, мс")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="сохранить сырые результаты в файл")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    workdir = tempfile.mkdtemp(prefix="kadrovik_bench_")
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        result = asyncio.run(run(args))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(report(result))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({**result, "args": vars(args)}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""Профиль холодного старта бота: время импорта модулей и первых обновлений.
+
+Каждый прогон запускается в отдельном процессе, чтобы импорт был действительно
+холодным. Данные (каталог из data/products.json) копируются во временный каталог,
+запросы к Bot API уходят в заглушку из benchmarks/load.py.
+
+    python benchmarks/startup.py --runs 5
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Модули в порядке зависимостей: каждый замер - цена того, что модуль добавляет к уже загруженному
+MODULES = [
+    "telegram", "telegram.ext", "config",
+    "storage.db", "storage.catalog", "storage.carts", "storage.orders", "storage.search",
+    "services.sender", "services.pricing", "services.outbox", "services.delivery", "services.metrics",
+    "handlers.router", "handlers.catalog", "handlers.cart", "handlers.payments", "handlers.search",
+    "handlers.admin", "bot",
+]
+
+
+def profile_once() -> dict:
+    """Выполняется в дочернем процессе: импорт, сборка приложения и первые обновления"""
+    import importlib
+    started = time.perf_counter()
+    imports = {}
+    for name in MODULES:
+        before = time.perf_counter()
+        importlib.import_module(name)
+        imports[name] = time.perf_counter() - before
+    imports_total = time.perf_counter() - started
+    loaded = sorted(name for name in sys.modules if name.split('.')[0] in ("handlers", "services", "storage"))
+
+    return asyncio.run(_first_updates(imports, imports_total, loaded))
+
+
+async def _first_updates(imports: dict, imports_total: float, loaded: list) -> dict:
+    sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+    import bot
+    from load import StubRequest, UpdateFactory
+    from handlers.router import encode
+
+    before = time.perf_counter()
+    application = bot.build_application(request=StubRequest())
+    build = time.perf_counter() - before
+
+    factory = UpdateFactory(application.bot)
+    user_id = 2000001
+    steps = [
+        ("/start", factory.command(user_id, "start")),
+        ("catalog", factory.callback(user_id, encode("catalog"))),
+        ("add", factory.callback(user_id, encode("add", "item_001"))),
+        ("view_cart", factory.callback(user_id, encode("view_cart"))),
+        ("/start (повторно)", factory.command(user_id, "start")),
+    ]
+    updates = {}
+    async with application:
+        before = time.perf_counter()
+        await bot.post_init(application)
+        post_init = time.perf_counter() - before
+        for label, update in steps:
+            before = time.perf_counter()
+            await application.process_update(update)
+            updates[label] = time.perf_counter() - before
+        await bot.post_shutdown(application)
+
+    return {
+        "imports": imports,
+        "imports_total": imports_total,
+        "loaded_modules": loaded,
+        "build": build,
+        "post_init": post_init,
+        "updates": updates,
+    }
+
+
+def run_child(workdir: str) -> dict:
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child"],
+        cwd=workdir, capture_output=True, text=True, check=True,
+        env={**os.environ, "PYTHONPATH": ROOT}
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def report(results: list) -> str:
+    def median_ms(values):
+        return statistics.median(values) * 1000
+
+    lines = [f"Прогонов: {len(results)} (медиана, мс)", "", "Импорт:"]
+    for name in MODULES:
+        lines.append(f"  {name:<22}{median_ms([r['imports'][name] for r in results]):>9.1f}")
+    lines.append(f"  {'всего':<22}{median_ms([r['imports_total'] for r in results]):>9.1f}")
+    lines.append("")
+    lines.append(f"Сборка приложения и регистрация: {median_ms([r['build'] for r in results]):.1f}")
+    lines.append(f"post_init (прогрев и фоновые задачи): {median_ms([r['post_init'] for r in results]):.1f}")
+    lines.append("")
+    lines.append("Первые обновления покупателя:")
+    for label in results[0]["updates"]:
+        lines.append(f"  {label:<22}{median_ms([r['updates'][label] for r in results]):>9.1f}")
+    lines.append("")
+    lines.append("Загруженные модули проекта: " + ", ".join(results[0]["loaded_modules"]))
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="число холодных запусков")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(profile_once()))
+        return
+
+    results = []
+    for _ in range(args.runs):
+        workdir = tempfile.mkdtemp(prefix="kadrovik_startup_")
+        try:
+            os.makedirs(os.path.join(workdir, 'data'))
+            shutil.copy(os.path.join(ROOT, 'data', 'products.json'), os.path.join(workdir, 'data'))
+            results.append(run_child(workdir))
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+    print(report(results))
+
+
+if __name__ == '__main__':
+    main()
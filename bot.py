@@ -1,16 +1,30 @@
+import asyncio
 import logging
-from config import BOT_TOKEN
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from config import BOT_TOKEN, CART_STORAGE, CONCURRENT_UPDATES, METRICS, PERSISTENCE, PROCESSES, SWEEPER, UPDATE_MODE, WEBHOOK
+from telegram import Bot, Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
     ApplicationBuilder,
     CommandHandler,
     CallbackQueryHandler,
     MessageHandler,
+    InlineQueryHandler,
     CallbackContext,
     ConversationHandler,
     filters
 )
-from handlers import catalog, cart, payments, admin
+from handlers import catalog, cart, payments, admin, search
+from handlers.router import CallbackRouter, encode, route_pattern
+from services import cluster, metrics, outbox, sweeper, webhook
+from services.concurrency import UserOrderedUpdateProcessor
+from services.sender import OutboundSender
+from storage import catalog as catalog_store
+from storage import carts as cart_store
+from storage import orders as order_store
+from storage import db
+from storage.access import run_in_every_worker, run_io
+from storage.persistence import SqlitePersistence
+from storage.search import index as search_index
+from services.intake import SEEN_LIMIT, intake as receipt_intake
 
 # Настройка логирования
 logging.basicConfig(
@@ -19,6 +33,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# (номер, всего) в рабочем процессе многопроцессного режима, иначе None
+SHARD = None
+
 # Главное меню
 async def start(update: Update, context: CallbackContext) -> None:
     user = update.effective_user
@@ -27,8 +44,8 @@ async def start(update: Update, context: CallbackContext) -> None:
         "Я помогу приобрести бланки приказов. Используй кнопки ниже:"
     )
     buttons = [
-        [InlineKeyboardButton("📁 Каталог", callback_data="catalog")],
-        [InlineKeyboardButton("🛒 Корзина", callback_data="view_cart")]
+        [InlineKeyboardButton("📁 Каталог", callback_data=encode("catalog"))],
+        [InlineKeyboardButton("🛒 Корзина", callback_data=encode("view_cart"))]
     ]
     
     if update.message:
@@ -36,66 +53,197 @@ async def start(update: Update, context: CallbackContext) -> None:
     elif update.callback_query:
         await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(buttons))
 
-def main() -> None:
-    # Используем токен из конфига
-    application = ApplicationBuilder().token(BOT_TOKEN).build()
+def prepare_storage() -> None:
+    """База, миграции и каталог. В многопроцессном режиме миграции выполняет фронт
+    до запуска рабочих процессов, чтобы они не переносили данные одновременно"""
+    catalog_store.get_products()
+    cart_store.get_storage().prepare()
+    order_store.prepare()
+
+def warm_up() -> None:
+    """Хранилище и поисковый индекс готовятся до первого обновления, а не во время него"""
+    prepare_storage()
+    search_index.rebuild()
+    # Повторно присланный после перезапуска чек тоже распознаётся как повтор
+    receipt_intake.load(order_store.recent_receipt_ids(SEEN_LIMIT))
+
+async def post_init(application) -> None:
+    await run_io(warm_up)
+    # У каждого потока хранилища своё соединение с SQLite
+    await run_in_every_worker(db.get_connection)
+    # Фоновая отправка сообщений из очереди (уведомления админу и т.п.)
+    outbox.start(application.bot, SHARD)
+    # Уборка общая для всех процессов, поэтому в многопроцессном режиме её ведёт первый
+    if SWEEPER["enabled"] and (SHARD is None or SHARD[0] == 0):
+        sweeper.start(application.job_queue, SWEEPER)
+    if METRICS["enabled"]:
+        # У каждого рабочего процесса свой порт: port, port + 1, ...
+        port = METRICS["port"] + (SHARD[0] if SHARD else 0)
+        await metrics.start(application, METRICS["host"], port, METRICS["log_interval"])
+
+async def post_shutdown(application) -> None:
+    await outbox.stop()
+    await metrics.stop()
+
+def webhook_options() -> dict:
+    """Параметры встроенного HTTP-сервера, на который Telegram присылает обновления"""
+    logger.info(
+        f"Webhook: http{'s' if WEBHOOK['cert'] else ''}://{WEBHOOK['listen']}:{WEBHOOK['port']}/{WEBHOOK['path']}"
+    )
+    return dict(
+        listen=WEBHOOK["listen"],
+        port=WEBHOOK["port"],
+        url_path=WEBHOOK["path"],
+        webhook_url=WEBHOOK["url"] or None,
+        secret_token=WEBHOOK["secret_token"] or None,
+        cert=WEBHOOK["cert"] or None,
+        key=WEBHOOK["key"] or None,
+        max_connections=WEBHOOK["max_connections"]
+    )
+
+def run_webhook(application) -> None:
+    options = webhook_options()
+    if not options["webhook_url"]:
+        # Адрес не задан: вебхук у Telegram не регистрируется, сервер только принимает запросы
+        application.updater = webhook.create_updater(application.bot, application.update_queue, options)
+    application.run_webhook(**options)
 
+def register_handlers(application) -> None:
     # Команды
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("admin", admin.admin_start))
-    
-    # Обработчики callback
-    application.add_handler(CallbackQueryHandler(start, pattern="main_menu"))
-    application.add_handler(CallbackQueryHandler(catalog.show_categories, pattern="catalog"))
-    application.add_handler(CallbackQueryHandler(catalog.show_items, pattern="category_"))
-    application.add_handler(CallbackQueryHandler(catalog.item_details, pattern="item_"))
-    
-    application.add_handler(CallbackQueryHandler(cart.view_cart, pattern="view_cart"))
-    application.add_handler(CallbackQueryHandler(cart.add_to_cart, pattern="add_"))
-    application.add_handler(CallbackQueryHandler(cart.clear_cart, pattern="clear_cart"))
-    
-    application.add_handler(CallbackQueryHandler(payments.checkout, pattern="checkout"))
-    application.add_handler(CallbackQueryHandler(payments.confirm_payment, pattern="confirm_payment"))
-    
-    # Обработка чеков
+    application.add_handler(CommandHandler("search", search.search_command))
+    application.add_handler(CommandHandler("stats", admin.admin_stats))
+    application.add_handler(CommandHandler("import", admin.admin_import))
+    application.add_handler(CommandHandler("export", admin.admin_export))
+    # Манифест каталога присылают документом с подписью /import; до обработчика чеков
     application.add_handler(MessageHandler(
-        filters.PHOTO | filters.Document.ALL,
-        payments.handle_receipt
+        filters.Document.ALL & filters.CaptionRegex(r"^/import(\s|$)"),
+        admin.admin_import
     ))
     
-    # Админ-панель
-    application.add_handler(CallbackQueryHandler(admin.admin_add_product_start, pattern="admin_add_product"))
-    application.add_handler(CallbackQueryHandler(admin.admin_remove_product, pattern="admin_remove_product"))
-    application.add_handler(CallbackQueryHandler(admin.admin_view_orders, pattern="admin_view_orders"))
-    application.add_handler(CallbackQueryHandler(admin.admin_confirm_remove, pattern="remove_"))
-    application.add_handler(CallbackQueryHandler(admin.cancel, pattern="cancel|admin_back"))
+    # Поиск в inline-режиме (@бот запрос); inline-режим включается у @BotFather
+    application.add_handler(InlineQueryHandler(search.inline_search))
     
-    # ConversationHandler для добавления товара
+    # ConversationHandler для добавления товара; регистрируется раньше маршрутизатора,
+    # чтобы кнопки диалога доходили до него, пока диалог идёт
     conv_handler = ConversationHandler(
-        entry_points=[CallbackQueryHandler(admin.admin_add_product_start, pattern="admin_add_product")],
+        entry_points=[CallbackQueryHandler(admin.admin_add_product_start, pattern=route_pattern("admin_add_product"))],
         states={
             admin.CATEGORY: [
-                CallbackQueryHandler(admin.admin_add_product_category),
+                CallbackQueryHandler(admin.admin_add_product_category, pattern=route_pattern("cat", "new_category")),
                 MessageHandler(filters.TEXT & ~filters.COMMAND, admin.admin_add_product_name)
             ],
             admin.NAME: [
-                MessageHandler(filters.TEXT & ~filters.COMMAND, admin.admin_add_product_price)
+                MessageHandler(filters.TEXT & ~filters.COMMAND, admin.admin_add_product_name)
             ],
             admin.PRICE: [
-                MessageHandler(filters.TEXT & ~filters.COMMAND, admin.admin_add_product_file)
+                MessageHandler(filters.TEXT & ~filters.COMMAND, admin.admin_add_product_price)
             ],
             admin.FILE: [
                 MessageHandler(filters.Document.ALL, admin.admin_add_product_file)
             ]
         },
-        fallbacks=[CommandHandler('cancel', admin.cancel)],
-        allow_reentry=True
+        fallbacks=[
+            CommandHandler('cancel', admin.cancel),
+            CallbackQueryHandler(admin.cancel, pattern=route_pattern("cancel"))
+        ],
+        allow_reentry=True,
+        # Незаконченное добавление товара переживает перезапуск, если включено сохранение
+        name="add_product",
+        persistent=application.persistence is not None
     )
     application.add_handler(conv_handler)
+    
+    # Остальные кнопки: действие из callback_data -> обработчик
+    router = CallbackRouter()
+    router.add("main_menu", start)
+    router.add("catalog", catalog.show_categories)
+    router.add("category", catalog.show_items)
+    router.add("item", catalog.item_details)
+    
+    router.add("view_cart", cart.view_cart)
+    router.add("add", cart.add_to_cart)
+    router.add("clear_cart", cart.clear_cart)
+    
+    router.add("checkout", payments.checkout)
+    router.add("confirm_payment", payments.confirm_payment)
+    
+    # Админ-панель
+    router.add("admin_remove_product", admin.admin_remove_product)
+    router.add("remove", admin.admin_confirm_remove)
+    router.add("admin_view_orders", admin.admin_view_orders)
+    router.add("orders", admin.admin_orders_page)
+    router.add("approve", admin.admin_approve_order)
+    router.add("admin_stats", admin.admin_stats)
+    router.add("admin_back", admin.cancel)
+    application.add_handler(CallbackQueryHandler(router.dispatch))
+    
+    # Обработка чеков
+    application.add_handler(MessageHandler(
+        filters.PHOTO | filters.Document.ALL,
+        payments.handle_receipt
+    ))
+    
+    router.verify(application)
+
+def build_application(shard: tuple = None, request=None):
+    """shard - (номер, всего) для рабочего процесса; request - клиент Bot API вместо HTTPX
+    (нагрузочный прогон подставляет заглушку, запросы к Bot API тогда не замеряются в метриках)"""
+    # Используем токен из конфига
+    builder = ApplicationBuilder().token(BOT_TOKEN).post_init(post_init).post_shutdown(post_shutdown)
+    if shard is not None:
+        # Обновления рабочему процессу передаёт фронт
+        builder = builder.updater(None)
+    # Ограничение скорости, повторы после 429 и склейка лишних запросов к Bot API;
+    # общий лимит бота делится между рабочими процессами
+    builder = builder.rate_limiter(OutboundSender(share=1 / shard[1] if shard else 1.0))
+    if CONCURRENT_UPDATES > 1:
+        builder = builder.concurrent_updates(UserOrderedUpdateProcessor(CONCURRENT_UPDATES))
+    if PERSISTENCE["enabled"]:
+        builder = builder.persistence(SqlitePersistence(update_interval=PERSISTENCE["update_interval"], shard=shard))
+    if request is not None:
+        builder = builder.request(request)
+        if shard is None:
+            builder = builder.get_updates_request(request)
+    elif METRICS["enabled"]:
+        # Замер запросов к Bot API (getUpdates идёт отдельным клиентом и не учитывается)
+        builder = builder.request(metrics.InstrumentedRequest(connection_pool_size=256))
+    application = builder.build()
+    register_handlers(application)
+    if METRICS["enabled"]:
+        metrics.instrument(application)
+    return application
+
+def run_worker(index: int, count: int, updates, done, wait_for) -> None:
+    """Точка входа рабочего процесса (services.cluster)"""
+    global SHARD
+    SHARD = (index, count)
+    application = build_application(SHARD)
+    asyncio.run(cluster.serve(application, updates, done, wait_for))
+
+def run_cluster() -> None:
+    """Фронт: принимает обновления и раздаёт их PROCESSES рабочим процессам по user_id"""
+    if CART_STORAGE != "sqlite":
+        raise RuntimeError('Многопроцессный режим требует CART_STORAGE = "sqlite"')
+    prepare_storage()
+    front = cluster.Front(run_worker, PROCESSES)
+    options = webhook_options() if UPDATE_MODE == "webhook" else None
+    asyncio.run(front.run(Bot(BOT_TOKEN), options))
+
+def main() -> None:
+    if PROCESSES > 1:
+        logger.info(f"Бот запущен в многопроцессном режиме ({PROCESSES} процессов)")
+        run_cluster()
+        return
+    application = build_application()
 
     # Запуск бота
     logger.info("Бот запущен!")
-    application.run_polling()
+    if UPDATE_MODE == "webhook":
+        run_webhook(application)
+    else:
+        application.run_polling()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
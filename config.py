@@ -14,6 +14,66 @@ PAYMENT_DETAILS = {
     "qiwi": "+79998887766"
 }
 
+# Хранилище корзин: "sqlite" (data/bot.db) или "json" (data/carts.json)
+CART_STORAGE = "sqlite"
+
+# Получение обновлений: "polling" (getUpdates) или "webhook" (Telegram присылает их сам)
+UPDATE_MODE = "polling"
+
+# Сколько обновлений разных пользователей обрабатывать одновременно
+# (обновления одного пользователя всегда идут по очереди). 1 - последовательно
+CONCURRENT_UPDATES = 16
+
+# Число рабочих процессов. При PROCESSES > 1 один процесс принимает обновления (polling
+# или webhook) и раздаёт их по user_id рабочим процессам с общей базой data/bot.db;
+# нужен CART_STORAGE = "sqlite". SIGHUP перезапускает рабочие процессы по одному без
+# потери обновлений (Linux, macOS). 1 - всё в одном процессе
+PROCESSES = 1
+
+# Метрики обработчиков: Prometheus-эндпоинт http://host:port/metrics и сводка в лог
+# раз в log_interval секунд (0 - без сводки). Выключенные метрики не влияют на скорость
+METRICS = {
+    "enabled": False,
+    "host": "127.0.0.1",
+    "port": 9108,
+    "log_interval": 300
+}
+
+# Настройки webhook-режима
+WEBHOOK = {
+    "listen": "0.0.0.0",
+    "port": 8443,
+    "path": "telegram",
+    # Публичный адрес для setWebhook, например "https://bot.example.com:8443/telegram".
+    # Пустая строка - вебхук у Telegram не регистрируется (локальная отладка)
+    "url": "",
+    # Проверяется в заголовке X-Telegram-Bot-Api-Secret-Token (A-Z, a-z, 0-9, _ и -)
+    "secret_token": "",
+    # Пути к самоподписанному сертификату и ключу (PEM), если TLS завершается в самом боте
+    "cert": "",
+    "key": "",
+    # Сколько одновременных соединений Telegram может открыть к вебхуку (1-100)
+    "max_connections": 40
+}
+
+# Сохранение user_data, chat_data и состояний диалогов (добавление товара) в data/bot.db,
+# чтобы они переживали перезапуск. Изменения пишутся пачкой раз в update_interval секунд
+PERSISTENCE = {
+    "enabled": True,
+    "update_interval": 10
+}
+
+# Фоновая уборка раз в interval секунд: удаляются корзины, не менявшиеся cart_ttl_days дней,
+# админ получает напоминание о заказах, ждущих подтверждения дольше pending_alert_hours часов.
+# Работа идёт порциями по batch_size строк, чтобы не задерживать обработку обновлений
+SWEEPER = {
+    "enabled": True,
+    "interval": 600,
+    "cart_ttl_days": 30,
+    "pending_alert_hours": 24,
+    "batch_size": 200
+}
+
 # Настройки базы данных (пример для будущего расширения)
 # DATABASE = {
 #     "host": "localhost",
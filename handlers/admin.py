@@ -1,9 +1,17 @@
-import json
 import logging
-import uuid
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import TelegramError
 from telegram.ext import CallbackContext, ConversationHandler, filters
 from config import ADMIN_ID
+from storage import catalog as catalog_store
+from storage import orders as order_store
+from storage import stats as stats_store
+from storage.access import lock, run_io
+from storage.search import index as search_index
+from services import delivery
+from services import manifest
+from .catalog import PAGE_SIZE, invalidate_views, page_count, page_navigation, parse_page
+from .router import decode, encode
 
 logger = logging.getLogger(__name__)
 
@@ -12,8 +20,6 @@ logger = logging.getLogger(__name__)
 CATEGORY, NAME, PRICE, FILE = range(4)
 
 async def admin_start(update: Update, context: CallbackContext) -> None:
-    from config import ADMIN_ID
-    
     # Проверяем, что команду вызвал администратор
     if update.effective_user.id != ADMIN_ID:
         await update.message.reply_text("❌ Доступ запрещен!")
@@ -27,13 +33,14 @@ async def admin_start(update: Update, context: CallbackContext) -> None:
         return
     
     keyboard = [
-        [InlineKeyboardButton("➕ Добавить товар", callback_data="admin_add_product")],
-        [InlineKeyboardButton("🗑️ Удалить товар", callback_data="admin_remove_product")],
-        [InlineKeyboardButton("📝 Список заказов", callback_data="admin_view_orders")]
+        [InlineKeyboardButton("➕ Добавить товар", callback_data=encode("admin_add_product"))],
+        [InlineKeyboardButton("🗑️ Удалить товар", callback_data=encode("admin_remove_product"))],
+        [InlineKeyboardButton("📝 Список заказов", callback_data=encode("admin_view_orders"))],
+        [InlineKeyboardButton("📊 Статистика", callback_data=encode("admin_stats", 7))]
     ]
     
     await update.message.reply_text(
-        "👑 Админ-панель:",
+        "👑 Админ-панель:\n\n/import, /export - загрузка и выгрузка каталога целиком",
         reply_markup=InlineKeyboardMarkup(keyboard)
     )
 
@@ -43,16 +50,15 @@ async def admin_add_product_start(update: Update, context: CallbackContext) -> i
         return ConversationHandler.END
     
     # Загружаем текущие категории
-    with open('data/products.json', 'r', encoding='utf-8') as f:
-        products = json.load(f)
+    products = catalog_store.get_products()
     
     # Создаем клавиатуру с категориями
     buttons = []
     for category in products["categories"]:
-        buttons.append([InlineKeyboardButton(category["name"], callback_data=f"cat_{category['id']}")])
+        buttons.append([InlineKeyboardButton(category["name"], callback_data=encode("cat", category['id']))])
     
-    buttons.append([InlineKeyboardButton("➕ Новая категория", callback_data="new_category")])
-    buttons.append([InlineKeyboardButton("❌ Отмена", callback_data="cancel")])
+    buttons.append([InlineKeyboardButton("➕ Новая категория", callback_data=encode("new_category"))])
+    buttons.append([InlineKeyboardButton("❌ Отмена", callback_data=encode("cancel"))])
     
     await update.callback_query.edit_message_text(
         "📁 Выберите категорию:",
@@ -63,15 +69,15 @@ async def admin_add_product_start(update: Update, context: CallbackContext) -> i
 async def admin_add_product_category(update: Update, context: CallbackContext) -> int:
     query = update.callback_query
     await query.answer()
-    data = query.data
+    action, args = decode(query.data)
     
-    if data == "new_category":
+    if action == "new_category":
         await query.edit_message_text("📝 Введите название новой категории:")
         context.user_data['new_category'] = True
         return CATEGORY
     
     # Сохраняем выбранную категорию
-    category_id = data.split('_')[1]
+    category_id = args[0]
     context.user_data['category_id'] = category_id
     context.user_data['new_category'] = False
     
@@ -83,20 +89,10 @@ async def admin_add_product_name(update: Update, context: CallbackContext) -> in
     if context.user_data.get('new_category'):
         category_name = update.message.text
         
-        # Генерируем ID для новой категории
-        new_category_id = f"cat_{uuid.uuid4().hex[:8]}"
-        
         # Добавляем категорию в products.json
-        with open('data/products.json', 'r+', encoding='utf-8') as f:
-            products = json.load(f)
-            products["categories"].append({
-                "id": new_category_id,
-                "name": category_name,
-                "items": []
-            })
-            f.seek(0)
-            json.dump(products, f, indent=2, ensure_ascii=False)
-            f.truncate()
+        async with lock("file", catalog_store.PRODUCTS_FILE):
+            new_category_id = await run_io(catalog_store.add_category, category_name)
+        invalidate_views()
         
         context.user_data['category_id'] = new_category_id
         context.user_data['new_category'] = False
@@ -131,27 +127,11 @@ async def admin_add_product_file(update: Update, context: CallbackContext) -> in
     name = context.user_data['name']
     price = context.user_data['price']
     
-    # Генерируем ID для товара
-    item_id = f"item_{uuid.uuid4().hex[:8]}"
-    
     # Добавляем товар в products.json
-    with open('data/products.json', 'r+', encoding='utf-8') as f:
-        products = json.load(f)
-        
-        # Находим категорию
-        for category in products["categories"]:
-            if category["id"] == category_id:
-                category["items"].append({
-                    "id": item_id,
-                    "name": name,
-                    "price": price,
-                    "file_id": file_id
-                })
-                break
-        
-        f.seek(0)
-        json.dump(products, f, indent=2, ensure_ascii=False)
-        f.truncate()
+    async with lock("file", catalog_store.PRODUCTS_FILE):
+        item_id = await run_io(catalog_store.add_item, category_id, name, price, file_id)
+    invalidate_views()
+    search_index.add(item_id)
     
     await update.message.reply_text(f"✅ Товар '{name}' успешно добавлен!")
     return ConversationHandler.END
@@ -161,70 +141,276 @@ async def admin_remove_product(update: Update, context: CallbackContext) -> None
         await update.callback_query.answer("❌ Доступ запрещен!")
         return
     
-    # Загружаем товары
-    with open('data/products.json', 'r', encoding='utf-8') as f:
-        products = json.load(f)
+    # admin_remove_product[:<страница>]
+    _, args = decode(update.callback_query.data)
+    page = parse_page(args, 0)
+    
+    # Берем из индекса каталога только товары текущей страницы
+    items, total = catalog_store.get_items_page(page * PAGE_SIZE, PAGE_SIZE)
     
     # Создаем клавиатуру с товарами
     buttons = []
-    for category in products["categories"]:
-        for item in category["items"]:
-            buttons.append([
-                InlineKeyboardButton(
-                    f"❌ {category['name']} - {item['name']}",
-                    callback_data=f"remove_{item['id']}"
-                )
-            ])
+    for category, item in items:
+        buttons.append([
+            InlineKeyboardButton(
+                f"❌ {category['name']} - {item['name']}",
+                callback_data=encode("remove", item['id'])
+            )
+        ])
     
-    buttons.append([InlineKeyboardButton("🔙 Назад", callback_data="admin_back")])
+    navigation = page_navigation(("admin_remove_product",), page, total)
+    if navigation:
+        buttons.append(navigation)
+    buttons.append([InlineKeyboardButton("🔙 Назад", callback_data=encode("admin_back"))])
     
+    text = "🗑️ Выберите товар для удаления:"
+    if page_count(total) > 1:
+        text = f"🗑️ Выберите товар для удаления (стр. {page + 1}/{page_count(total)}):"
     await update.callback_query.edit_message_text(
-        "🗑️ Выберите товар для удаления:",
+        text,
         reply_markup=InlineKeyboardMarkup(buttons)
     )
 
 async def admin_confirm_remove(update: Update, context: CallbackContext) -> None:
     query = update.callback_query
-    item_id = query.data.split('_')[1]
+    if query.from_user.id != ADMIN_ID:
+        await query.answer("❌ Доступ запрещен!")
+        return
+    
+    _, args = decode(query.data)
+    item_id = args[0]
     
     # Удаляем товар из products.json
-    with open('data/products.json', 'r+', encoding='utf-8') as f:
-        products = json.load(f)
-        
-        for category in products["categories"]:
-            category["items"] = [item for item in category["items"] if item["id"] != item_id]
-        
-        f.seek(0)
-        json.dump(products, f, indent=2, ensure_ascii=False)
-        f.truncate()
+    async with lock("file", catalog_store.PRODUCTS_FILE):
+        await run_io(catalog_store.remove_item, item_id)
+    invalidate_views()
+    search_index.remove(item_id)
     
     await query.edit_message_text("✅ Товар успешно удален!")
 
+# Фильтры списка заказов: статус -> подпись кнопки
+ORDER_FILTERS = {
+    "pending": "⏳ Ожидают",
+    "paid": "💳 Оплачены",
+    "delivered": "📦 Доставлены",
+    "all": "🗂 Все"
+}
+ORDERS_PAGE_SIZE = 5
+
 async def admin_view_orders(update: Update, context: CallbackContext) -> None:
     if update.callback_query.from_user.id != ADMIN_ID:
         await update.callback_query.answer("❌ Доступ запрещен!")
         return
     
-    try:
-        with open('data/orders.json', 'r', encoding='utf-8') as f:
-            orders = json.load(f)
-    except FileNotFoundError:
-        await update.callback_query.edit_message_text("📭 Нет активных заказов")
+    await _show_orders_page(update.callback_query, "pending")
+
+async def admin_orders_page(update: Update, context: CallbackContext) -> None:
+    query = update.callback_query
+    if query.from_user.id != ADMIN_ID:
+        await query.answer("❌ Доступ запрещен!")
         return
     
-    if not orders:
-        await update.callback_query.edit_message_text("📭 Нет активных заказов")
-        return
+    # orders:<статус>:<older|newer>:<id заказа-курсора>
+    _, (status, direction, cursor) = decode(query.data)
+    cursor = int(cursor)
+    await _show_orders_page(
+        query,
+        status,
+        before_id=cursor if direction == "older" else None,
+        after_id=cursor if direction == "newer" else None
+    )
+
+async def _show_orders_page(query, status: str, before_id: int = None, after_id: int = None) -> None:
+    orders, has_older, has_newer = await run_io(
+        order_store.page_orders,
+        status=None if status == "all" else status,
+        before_id=before_id,
+        after_id=after_id,
+        limit=ORDERS_PAGE_SIZE
+    )
     
-    text = "📋 Активные заказы:\n\n"
-    for user_id, order in orders.items():
-        text += f"👤 Пользователь: {order.get('username', 'Unknown')} (ID: {user_id})\n"
+    buttons = [[
+        InlineKeyboardButton(("• " if key == status else "") + label, callback_data=encode("orders", key, "older", 0))
+        for key, label in ORDER_FILTERS.items()
+    ]]
+    
+    if not orders:
+        text = "📭 Нет заказов"
+    else:
+        text = f"📋 Заказы ({ORDER_FILTERS[status]}):\n\n"
+    for order in orders:
+        text += f"🧾 Заказ №{order['id']}\n"
+        text += f"👤 Пользователь: {order.get('username', 'Unknown')} (ID: {order['user_id']})\n"
         text += f"📅 Дата: {order.get('date', 'N/A')}\n"
         text += f"💎 Сумма: {order.get('total', 0)}₽\n"
         text += f"🔄 Статус: {order.get('status', 'pending')}\n"
         text += "------------------------\n"
+        if order["status"] == "pending":
+            buttons.append([InlineKeyboardButton(f"✅ Подтвердить №{order['id']}", callback_data=encode("approve", order['id']))])
+    
+    navigation = []
+    if has_newer:
+        navigation.append(InlineKeyboardButton("⬅️ Новее", callback_data=encode("orders", status, "newer", orders[0]['id'])))
+    if has_older:
+        navigation.append(InlineKeyboardButton("Старее ➡️", callback_data=encode("orders", status, "older", orders[-1]['id'])))
+    if navigation:
+        buttons.append(navigation)
+    
+    await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(buttons))
+
+async def admin_approve_order(update: Update, context: CallbackContext) -> None:
+    query = update.callback_query
+    if query.from_user.id != ADMIN_ID:
+        await query.answer("❌ Доступ запрещен!")
+        return
+    
+    _, args = decode(query.data)
+    order_id = int(args[0])
+    result = await delivery.approve_order(order_id)
+    if not result:
+        await query.answer(f"Заказ №{order_id} не найден или уже подтвержден")
+        return
+    
+    order, missing = result
+    if len(missing) == len(order["items"]):
+        text = f"⚠️ Заказ №{order_id} подтвержден, но покупателю ничего не отправлено: ни у одного товара нет файла."
+    else:
+        text = f"✅ Заказ №{order_id} подтвержден, файлы отправляются покупателю."
+    if missing:
+        text += "\n\n⚠️ Нет файла у товаров (отправьте вручную):\n" + "\n".join(f"- {name}" for name in missing)
+    await query.answer()
+    await query.edit_message_text(text)
+
+# Периоды статистики в днях и сколько строк показывать в разбивках
+STATS_PERIODS = (1, 7, 30)
+STATS_TOP = 10
+
+async def admin_stats(update: Update, context: CallbackContext) -> None:
+    """/stats [дней | rebuild] и кнопки периодов: продажи из итогов по дням"""
+    query = update.callback_query
+    if update.effective_user.id != ADMIN_ID:
+        if query:
+            await query.answer("❌ Доступ запрещен!")
+        else:
+            await update.message.reply_text("❌ Доступ запрещен!")
+        return
+    
+    if query:
+        _, args = decode(query.data)
+    else:
+        args = context.args or []
+    
+    if args and args[0] == "rebuild":
+        count = await run_io(stats_store.rebuild)
+        await update.message.reply_text(f"✅ Статистика пересчитана по {count} заказам")
+        return
+    days = int(args[0]) if args and args[0].isdigit() and int(args[0]) > 0 else 7
+    
+    summary = await run_io(stats_store.summary, days)
+    text = _format_stats(days, summary)
+    buttons = [
+        [InlineKeyboardButton(("• " if period == days else "") + f"{period} дн.", callback_data=encode("admin_stats", period))
+         for period in STATS_PERIODS],
+        [InlineKeyboardButton("🔙 Назад", callback_data=encode("admin_back"))]
+    ]
+    if query:
+        await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(buttons))
+    else:
+        await update.message.reply_text(text, reply_markup=InlineKeyboardMarkup(buttons))
+
+def _format_stats(days: int, summary: dict) -> str:
+    paid_orders, paid_units, paid_revenue = summary["total"].get("paid", (0, 0, 0))
+    pending_orders, _, pending_revenue = summary["total"].get("pending", (0, 0, 0))
+    text = (
+        f"📊 Продажи за {days} дн. (с {summary['since']}):\n\n"
+        f"💎 Оплачено: {paid_orders} зак., {paid_units} шт., {paid_revenue}₽\n"
+        f"⏳ Ждут подтверждения: {pending_orders} зак., {pending_revenue}₽\n"
+    )
+    for title, entries in (("📁 Категории", summary["categories"]), ("📝 Товары", summary["items"])):
+        if not entries:
+            continue
+        text += f"\n{title} (оплачено):\n"
+        for label, orders, units, revenue in entries[:STATS_TOP]:
+            text += f"- {label}: {orders} зак., {units} шт., {revenue}₽\n"
+        if len(entries) > STATS_TOP:
+            text += f"... и ещё {len(entries) - STATS_TOP}\n"
+    return text
+
+IMPORT_HELP = (
+    "📦 Массовая загрузка каталога\n\n"
+    "Пришлите документ с подписью /import:\n"
+    "- CSV или JSON с колонками id, category, name, price, file_id;\n"
+    "- или ZIP-архив с manifest.csv (manifest.json) и документами, "
+    "на которые ссылается колонка file.\n\n"
+    "Товары с id или с тем же названием в категории обновляются, остальные добавляются. "
+    "С подписью \"/import replace\" товары, которых нет в манифесте, удаляются, "
+    "а категории, которые из-за этого опустели, - вместе с ними.\n\n"
+    "/export - текущий каталог в CSV (/export json - в JSON)"
+)
+# Сколько ошибок манифеста показывать в ответе
+IMPORT_ERRORS_SHOWN = 10
+
+async def admin_import(update: Update, context: CallbackContext) -> None:
+    """/import: манифест проверяется целиком и применяется к каталогу одной записью"""
+    if update.effective_user.id != ADMIN_ID:
+        await update.message.reply_text("❌ Доступ запрещен!")
+        return
+    document = update.message.document
+    if not document:
+        await update.message.reply_text(IMPORT_HELP)
+        return
+    if document.file_size and document.file_size > manifest.MAX_DOWNLOAD_SIZE:
+        await update.message.reply_text("❌ Бот может скачать файл не больше 20 МБ. Разделите архив на части.")
+        return
+    replace = "replace" in (update.message.caption or "").split()[1:]
+    
+    telegram_file = await document.get_file()
+    data = bytes(await telegram_file.download_as_bytearray())
+    rows, files, errors = await run_io(manifest.parse, document.file_name or "", data)
+    if errors:
+        text = "❌ Каталог не изменён, исправьте манифест:\n\n" + "\n".join(errors[:IMPORT_ERRORS_SHOWN])
+        if len(errors) > IMPORT_ERRORS_SHOWN:
+            text += f"\n... и ещё {len(errors) - IMPORT_ERRORS_SHOWN}"
+        await update.message.reply_text(text)
+        return
     
-    await update.callback_query.edit_message_text(text)
+    if files:
+        # file_id появляется только у загруженного в Telegram документа
+        await update.message.reply_text(f"⏳ Загружаю документы: {len(files)}...")
+        try:
+            file_ids = await manifest.upload_files(context.bot, update.effective_chat.id, files)
+        except TelegramError as e:
+            logger.error(f"Ошибка загрузки документов импорта: {e}")
+            await update.message.reply_text(f"❌ Не удалось загрузить документы ({e}). Каталог не изменён.")
+            return
+        for row in rows:
+            if row.get("file"):
+                row["file_id"] = file_ids[row["file"]]
+    
+    async with lock("file", catalog_store.PRODUCTS_FILE):
+        result = await run_io(catalog_store.import_items, rows, replace)
+    invalidate_views()
+    await run_io(search_index.rebuild)
+    logger.info(f"Импорт каталога: {result}")
+    
+    text = (
+        f"✅ Каталог обновлён: добавлено {result['added']}, "
+        f"обновлено {result['updated']}, удалено {result['removed']}"
+    )
+    if result["removed_categories"]:
+        text += "\n\n🗑 Опустевшие категории удалены: " + ", ".join(result["removed_categories"])
+    await update.message.reply_text(text)
+
+async def admin_export(update: Update, context: CallbackContext) -> None:
+    """/export [json]: каталог файлом, который можно отредактировать и вернуть через /import"""
+    if update.effective_user.id != ADMIN_ID:
+        await update.message.reply_text("❌ Доступ запрещен!")
+        return
+    if context.args and context.args[0].lower() == "json":
+        data, filename = await run_io(manifest.export_json), "catalog.json"
+    else:
+        data, filename = await run_io(manifest.export_csv), "catalog.csv"
+    await update.message.reply_document(data, filename=filename)
 
 async def cancel(update: Update, context: CallbackContext) -> int:
     if update.callback_query:
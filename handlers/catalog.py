@@ -1,75 +1,103 @@
-import json
 import logging
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import CallbackContext
+from storage import catalog as catalog_store
+from .router import decode, encode
 
 logger = logging.getLogger(__name__)
-PRODUCTS_FILE = 'data/products.json'
+
+# Готовые (текст, клавиатура) для экранов каталога текущей версии
+_views = {}
+_views_version = None
+# Сколько товаров показывать на одной странице клавиатуры
+PAGE_SIZE = 8
 
 def load_products():
-    try:
-        with open(PRODUCTS_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError) as e:
-        logger.error(f"Ошибка загрузки товаров: {e}")
-        return {"categories": []}
+    # Каталог держится в памяти и перечитывается только при изменении файла
+    return catalog_store.get_products()
 
-async def show_categories(update: Update, context: CallbackContext) -> None:
-    products = load_products()
+def parse_page(args: list, index: int) -> int:
+    """Номер страницы из аргументов callback_data; без него - первая страница"""
+    page = args[index] if len(args) > index else ""
+    return int(page) if page.isdigit() else 0
+
+def page_navigation(callback: tuple, page: int, total: int) -> list:
+    """Кнопки перехода между страницами; callback - (действие, аргументы...) без номера страницы"""
     buttons = []
-    for category in products["categories"]:
-        buttons.append([InlineKeyboardButton(category["name"], callback_data=f"category_{category['id']}")])
-    
-    # Добавляем кнопку корзины
-    buttons.append([InlineKeyboardButton("🛒 Корзина", callback_data="view_cart")])
-    buttons.append([InlineKeyboardButton("🔙 Главное меню", callback_data="main_menu")])
+    if page > 0:
+        buttons.append(InlineKeyboardButton("⬅️", callback_data=encode(*callback, page - 1)))
+    if (page + 1) * PAGE_SIZE < total:
+        buttons.append(InlineKeyboardButton("➡️", callback_data=encode(*callback, page + 1)))
+    return buttons
+
+def page_count(total: int) -> int:
+    return max((total + PAGE_SIZE - 1) // PAGE_SIZE, 1)
+
+def invalidate_views() -> None:
+    """Сбрасывает кэш экранов (вызывается после изменений каталога в админке)"""
+    global _views_version
+    _views.clear()
+    _views_version = None
+
+def _cached_view(key, render):
+    """Возвращает экран из кэша; при смене версии каталога кэш очищается целиком"""
+    global _views_version
+    version = catalog_store.get_version()
+    if version != _views_version:
+        _views.clear()
+        _views_version = version
     
-    query = update.callback_query
-    await query.edit_message_text(
-        "📚 Выберите категорию:",
-        reply_markup=InlineKeyboardMarkup(buttons)
-    )
+    view = _views.get(key)
+    if view is None:
+        view = render()
+        # Несуществующие категории и товары не кэшируем
+        if view is not None:
+            _views[key] = view
+    return view
 
-async def show_items(update: Update, context: CallbackContext) -> None:
-    category_id = update.callback_query.data.split("_", 1)[1]
-    products = load_products()
+def _render_categories():
+    buttons = []
+    for category in load_products()["categories"]:
+        buttons.append([InlineKeyboardButton(category["name"], callback_data=encode("category", category['id']))])
     
-    category = next((cat for cat in products["categories"] if cat["id"] == category_id), None)
+    # Добавляем кнопку корзины
+    buttons.append([InlineKeyboardButton("🛒 Корзина", callback_data=encode("view_cart"))])
+    buttons.append([InlineKeyboardButton("🔙 Главное меню", callback_data=encode("main_menu"))])
+    return "📚 Выберите категорию:", InlineKeyboardMarkup(buttons)
+
+def _render_items(category_id: str, page: int):
+    category = catalog_store.get_category(category_id)
     if not category:
-        await update.callback_query.answer("Категория не найдена!")
-        return
+        return None
+    
+    # В клавиатуру попадает только видимое окно товаров
+    items = category["items"]
+    pages = page_count(len(items))
+    if page >= pages:
+        return None
     
     buttons = []
-    for item in category["items"]:
-        buttons.append([InlineKeyboardButton(f"{item['name']} - {item['price']}₽", callback_data=f"item_{item['id']}")])
+    for item in items[page * PAGE_SIZE:(page + 1) * PAGE_SIZE]:
+        buttons.append([InlineKeyboardButton(f"{item['name']} - {item['price']}₽", callback_data=encode("item", item['id']))])
+    
+    navigation = page_navigation(("category", category_id), page, len(items))
+    if navigation:
+        buttons.append(navigation)
     
     # Добавляем кнопку корзины
-    buttons.append([InlineKeyboardButton("🛒 Корзина", callback_data="view_cart")])
-    buttons.append([InlineKeyboardButton("🔙 Назад", callback_data="catalog")])
+    buttons.append([InlineKeyboardButton("🛒 Корзина", callback_data=encode("view_cart"))])
+    buttons.append([InlineKeyboardButton("🔙 Назад", callback_data=encode("catalog"))])
     
-    await update.callback_query.edit_message_text(
-        f"Товары в категории {category['name']}:",
-        reply_markup=InlineKeyboardMarkup(buttons)
-    )
+    text = f"Товары в категории {category['name']}:"
+    if pages > 1:
+        text = f"Товары в категории {category['name']} (стр. {page + 1}/{pages}):"
+    return text, InlineKeyboardMarkup(buttons)
 
-async def item_details(update: Update, context: CallbackContext) -> None:
-    item_id = update.callback_query.data.split("_", 1)[1]
-    products = load_products()
-    
-    item = None
-    category_with_item = None
-    for category in products["categories"]:
-        for product in category["items"]:
-            if product["id"] == item_id:
-                item = product
-                category_with_item = category
-                break
-        if item: 
-            break
-    
+def _render_item(item_id: str):
+    item = catalog_store.get_item(item_id)
+    category_with_item = catalog_store.get_item_category(item_id)
     if not item:
-        await update.callback_query.answer("Товар не найден!")
-        return
+        return None
     
     text = (
         f"📝 *{item['name']}*\n\n"
@@ -78,13 +106,44 @@ async def item_details(update: Update, context: CallbackContext) -> None:
     )
     
     buttons = [
-        [InlineKeyboardButton("🛒 Добавить в корзину", callback_data=f"add_{item_id}")],
-        [InlineKeyboardButton("🛒 Корзина", callback_data="view_cart")],
-        [InlineKeyboardButton("🔙 Назад", callback_data=f"category_{category_with_item['id']}")]
+        [InlineKeyboardButton("🛒 Добавить в корзину", callback_data=encode("add", item_id))],
+        [InlineKeyboardButton("🛒 Корзина", callback_data=encode("view_cart"))],
+        # Возвращаемся на ту страницу категории, где был товар
+        [InlineKeyboardButton("🔙 Назад", callback_data=encode(
+            "category", category_with_item['id'], catalog_store.get_item_position(item_id) // PAGE_SIZE
+        ))]
     ]
+    return text, InlineKeyboardMarkup(buttons)
+
+async def show_categories(update: Update, context: CallbackContext) -> None:
+    text, markup = _cached_view(("categories",), _render_categories)
+    
+    query = update.callback_query
+    await query.edit_message_text(text, reply_markup=markup)
+
+async def show_items(update: Update, context: CallbackContext) -> None:
+    # category:<id категории>[:<страница>]
+    _, args = decode(update.callback_query.data)
+    category_id, page = args[0], parse_page(args, 1)
+    view = _cached_view(("category", category_id, page), lambda: _render_items(category_id, page))
+    if not view:
+        await update.callback_query.answer("Категория не найдена!")
+        return
+    
+    text, markup = view
+    await update.callback_query.edit_message_text(text, reply_markup=markup)
+
+async def item_details(update: Update, context: CallbackContext) -> None:
+    _, args = decode(update.callback_query.data)
+    item_id = args[0]
+    view = _cached_view(("item", item_id), lambda: _render_item(item_id))
+    if not view:
+        await update.callback_query.answer("Товар не найден!")
+        return
     
+    text, markup = view
     await update.callback_query.edit_message_text(
         text, 
-        reply_markup=InlineKeyboardMarkup(buttons),
+        reply_markup=markup,
         parse_mode="Markdown"
     )
\ No newline at end of file
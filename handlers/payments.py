@@ -1,24 +1,30 @@
-import json
 import logging
 import datetime
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import CallbackContext
+from storage import catalog as catalog_store
+from storage import orders as order_store
+from storage.access import lock, run_io
+from services import outbox
+from services.intake import DUPLICATE, THROTTLED, intake as receipt_intake
+from services.pricing import price_cart
+from .cart import clear_user_cart, get_user_cart
+from .router import encode
 
 logger = logging.getLogger(__name__)
 # Замените на ваш Telegram ID
 ADMIN_ID = 999077284
 
 async def checkout(update: Update, context: CallbackContext) -> None:
-    from .cart import get_user_cart
-    
     user_id = update.callback_query.from_user.id
-    cart = get_user_cart(user_id)
+    cart = await run_io(get_user_cart, user_id)
+    priced = price_cart(user_id, cart)
     
-    if not cart:
+    if not priced["lines"]:
         await update.callback_query.answer("🛒 Ваша корзина пуста!")
         return
     
-    total = sum(item["price"] * item["quantity"] for item in cart)
+    total = priced["total"]
     
     # Реквизиты для оплаты (замените на свои)
     payment_details = (
@@ -31,8 +37,8 @@ async def checkout(update: Update, context: CallbackContext) -> None:
     )
     
     buttons = [
-        [InlineKeyboardButton("✅ Я оплатил", callback_data="confirm_payment")],
-        [InlineKeyboardButton("🔙 Назад", callback_data="view_cart")]
+        [InlineKeyboardButton("✅ Я оплатил", callback_data=encode("confirm_payment"))],
+        [InlineKeyboardButton("🔙 Назад", callback_data=encode("view_cart"))]
     ]
     
     await update.callback_query.edit_message_text(
@@ -51,95 +57,104 @@ async def confirm_payment(update: Update, context: CallbackContext) -> None:
     )
 
 async def handle_receipt(update: Update, context: CallbackContext) -> None:
-    from .cart import get_user_cart, clear_user_cart
+    message = update.message
+    user_id = message.from_user.id
+    receipt = message.photo[-1] if message.photo else message.document
+    
+    # Повторы и потоки чеков отсеиваются в памяти, до хранилища и уведомлений админу
+    verdict = receipt_intake.check(user_id, receipt.file_unique_id)
+    if verdict == DUPLICATE:
+        if receipt_intake.should_notify(user_id):
+            await message.reply_text("ℹ️ Этот чек уже получен, повторно отправлять не нужно.")
+        return
+    if verdict == THROTTLED:
+        if receipt_intake.should_notify(user_id):
+            await message.reply_text("⏳ Слишком много чеков подряд. Подождите минуту и отправьте снова.")
+        return
     
+    # Чеки одного пользователя обрабатываются по очереди, чтобы корзина не ушла в два заказа
+    async with lock("cart", user_id):
+        order_id = await _process_receipt(update, context)
+    if order_id is None:
+        receipt_intake.forget(receipt.file_unique_id)
+
+async def _process_receipt(update: Update, context: CallbackContext):
+    """Создаёт заказ по чеку; возвращает его номер или None, если заказ не создан"""
     user = update.message.from_user
     user_id = user.id
-    cart = get_user_cart(user_id)
+    cart = await run_io(get_user_cart, user_id)
+    priced = price_cart(user_id, cart)
     
-    if not cart:
+    if not priced["lines"]:
         await update.message.reply_text("❌ Ваша корзина пуста! Оформите заказ заново.")
         return
     
     # Проверяем тип контента: фото или документ
     if update.message.photo:
-        file_id = update.message.photo[-1].file_id
+        receipt = update.message.photo[-1]
     elif update.message.document:
-        file_id = update.message.document.file_id
+        receipt = update.message.document
     else:
         await update.message.reply_text("❌ Пожалуйста, отправьте фото или документ!")
         return
+    file_id = receipt.file_id
     
     # Формируем информацию о заказе
-    total = sum(item["price"] * item["quantity"] for item in cart)
+    total = priced["total"]
     order_details = "\n".join(
-        f"- {item['name']} x{item['quantity']} = {item['price'] * item['quantity']}₽"
-        for item in cart
+        f"- {line['name']} x{line['quantity']} = {line['sum']}₽"
+        for line in priced["lines"]
     )
     
-    # Сохраняем заказ
+    # Сохраняем заказ; в заказе фиксируются цены, названия и категории на момент оплаты
+    items = []
+    for line in priced["lines"]:
+        item = {key: line[key] for key in ("id", "name", "price", "quantity", "file_id")}
+        items.append(dict(item, **order_store.category_fields(catalog_store.get_item_category(line["id"]))))
     order_data = {
         "user_id": user_id,
         "username": user.username or user.full_name,
         "date": datetime.datetime.now().strftime("%Y-%m-%d %H:%M"),
-        "items": cart.copy(),
+        "items": items,
         "total": total,
         "status": "pending",
-        "receipt_file_id": file_id
+        "receipt_file_id": file_id,
+        "receipt_unique_id": receipt.file_unique_id
     }
     
-    # Сохраняем в orders.json
-    orders = {}
-    try:
-        with open('data/orders.json', 'r', encoding='utf-8') as f:
-            content = f.read()
-            if content.strip():
-                orders = json.loads(content)
-    except (FileNotFoundError, json.JSONDecodeError):
-        pass
-    
-    orders[str(user_id)] = order_data
-    
+    # Уведомление и чек админу уходят из фоновой очереди, клиент их не ждёт
+    if update.message.photo:
+        receipt_message = (ADMIN_ID, "send_photo", {"photo": file_id, "caption": "Чек об оплате"})
+    else:
+        receipt_message = (ADMIN_ID, "send_document", {"document": file_id, "caption": "Чек об оплате"})
+
+    def notify(order_id: int) -> list:
+        return [
+            (ADMIN_ID, "send_message", {"text": (
+                f"🚀 НОВЫЙ ЗАКАЗ №{order_id}!\n\n"
+                f"👤 Пользователь: @{user.username} ({user.full_name})\n"
+                f"🆔 ID: {user_id}\n\n"
+                f"📦 Состав заказа:\n{order_details}\n\n"
+                f"💎 Итого: {total}₽"
+            ), "reply_markup": {"inline_keyboard": [[
+                {"text": "✅ Подтвердить оплату", "callback_data": encode("approve", order_id)}
+            ]]}}),
+            receipt_message
+        ]
+
+    # Добавляем заказ в журнал вместе с уведомлением админу
     try:
-        with open('data/orders.json', 'w', encoding='utf-8') as f:
-            json.dump(orders, f, ensure_ascii=False, indent=2)
+        order_id = await run_io(order_store.create_order, order_data, notify)
     except Exception as e:
         logger.error(f"Ошибка сохранения заказа: {e}")
         await update.message.reply_text("❌ Ошибка обработки заказа!")
         return
-    
-    # Отправляем уведомление админу
-    try:
-        await context.bot.send_message(
-            ADMIN_ID,
-            f"🚀 НОВЫЙ ЗАКАЗ!\n\n"
-            f"👤 Пользователь: @{user.username} ({user.full_name})\n"
-            f"🆔 ID: {user_id}\n\n"
-            f"📦 Состав заказа:\n{order_details}\n\n"
-            f"💎 Итого: {total}₽"
-        )
-        
-        # Пересылаем чек админу
-        if update.message.photo:
-            await context.bot.send_photo(
-                chat_id=ADMIN_ID,
-                photo=file_id,
-                caption="Чек об оплате"
-            )
-        else:
-            await context.bot.send_document(
-                chat_id=ADMIN_ID,
-                document=file_id,
-                caption="Чек об оплате"
-            )
-    except Exception as e:
-        logger.error(f"Ошибка отправки уведомления админу: {e}")
-        await update.message.reply_text("⚠️ Произошла ошибка при обработке чека. Попробуйте позже.")
-        return
+    outbox.wake()
     
     # Очищаем корзину и завершаем процесс
-    clear_user_cart(user_id)
+    await run_io(clear_user_cart, user_id)
     await update.message.reply_text(
-        "✅ Чек успешно получен! Ваш заказ передан на обработку.\n\n"
+        f"✅ Чек успешно получен! Ваш заказ №{order_id} передан на обработку.\n\n"
         "⌛ Файлы будут отправлены вам в течение 15 минут после проверки платежа."
-    )
\ No newline at end of file
+    )
+    return order_id
\ No newline at end of file
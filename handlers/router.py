@@ -0,0 +1,126 @@
+import logging
+import re
+from telegram import Update
+from telegram.ext import CallbackContext, CallbackQueryHandler, ConversationHandler
+from services.sender import current_query
+
+logger = logging.getLogger(__name__)
+
+# callback_data кнопок имеет вид "<действие>[:<аргумент>...]"
+SEPARATOR = ":"
+# Ограничение Telegram на длину callback_data
+MAX_DATA_LENGTH = 64
+
+# Все действия, которые кнопки бота могут прислать в callback_data
+ACTIONS = frozenset({
+    # Покупатель
+    "main_menu", "catalog", "category", "item", "view_cart", "add", "clear_cart",
+    "checkout", "confirm_payment",
+    # Админ-панель
+    "admin_add_product", "admin_remove_product", "remove", "admin_view_orders",
+    "orders", "approve", "admin_stats", "admin_back",
+    # Диалог добавления товара
+    "cat", "new_category", "cancel",
+})
+
+
+def encode(action: str, *args) -> str:
+    """Собирает callback_data для кнопки; неизвестное действие или длинные данные - ошибка"""
+    if action not in ACTIONS:
+        raise ValueError(f"Неизвестное действие кнопки: {action}")
+    args = [str(arg) for arg in args]
+    if any(SEPARATOR in arg for arg in args):
+        raise ValueError(f"Аргумент кнопки {action} содержит '{SEPARATOR}': {args}")
+
+    data = SEPARATOR.join([action, *args])
+    if len(data.encode('utf-8')) > MAX_DATA_LENGTH:
+        raise ValueError(f"callback_data длиннее {MAX_DATA_LENGTH} байт: {data}")
+    return data
+
+
+def decode(data: str) -> tuple:
+    """Разбирает callback_data на (действие, [аргументы])"""
+    action, *args = (data or "").split(SEPARATOR)
+    return action, args
+
+
+def route_pattern(*actions) -> re.Pattern:
+    """Шаблон для CallbackQueryHandler внутри ConversationHandler: ровно эти действия"""
+    for action in actions:
+        if action not in ACTIONS:
+            raise ValueError(f"Неизвестное действие кнопки: {action}")
+    return re.compile(f"^(?:{'|'.join(map(re.escape, actions))})(?:{SEPARATOR}|$)")
+
+
+class CallbackRouter:
+    """Нажатия кнопок, не занятые диалогами, разбираются одним поиском по действию"""
+
+    def __init__(self):
+        self.routes = {}
+
+    def add(self, action: str, callback) -> None:
+        if action not in ACTIONS:
+            raise ValueError(f"Неизвестное действие кнопки: {action}")
+        if action in self.routes:
+            raise ValueError(f"Действие {action} уже назначено: {self.routes[action].__name__}")
+        self.routes[action] = callback
+
+    async def dispatch(self, update: Update, context: CallbackContext):
+        query = update.callback_query
+        action, _ = decode(query.data)
+        callback = self.routes.get(action)
+        if callback is None:
+            # Кнопка из старого сообщения или диалога, который уже завершён
+            logger.warning(f"Нет обработчика для кнопки {query.data!r} (пользователь {query.from_user.id})")
+            await query.answer("Кнопка устарела, откройте меню заново: /start")
+            return
+        # Отправитель отвечает на нажатие, если правка экрана оказалась лишней
+        token = current_query.set(query)
+        try:
+            return await callback(update, context)
+        finally:
+            current_query.reset(token)
+
+    def verify(self, application) -> None:
+        """Проверяет при запуске, что каждое действие попадает ровно в один обработчик.
+
+        Кнопки создаются только через encode(), который принимает лишь действия из
+        ACTIONS, поэтому проверка всех ACTIONS покрывает любую кнопку бота.
+        """
+        patterns = self._all_patterns(application)
+        problems = []
+        for action in sorted(ACTIONS):
+            targets = self._targets(patterns, action)
+            if len(targets) != 1:
+                problems.append(f"{action}: {targets or 'нет обработчика'}")
+        if problems:
+            raise RuntimeError("Маршрутизация кнопок неоднозначна:\n" + "\n".join(problems))
+
+    def resolve(self, application, data: str) -> list:
+        """Имена обработчиков, подходящих для нажатия с этой callback_data (должен быть ровно один)"""
+        return self._targets(self._all_patterns(application), data)
+
+    def _targets(self, patterns: list, data: str) -> list:
+        targets = [name for name, pattern in patterns if pattern is None or re.match(pattern, data)]
+        action = data.split(SEPARATOR, 1)[0]
+        if action in self.routes:
+            targets.append(self.routes[action].__name__)
+        return targets
+
+    def _all_patterns(self, application) -> list:
+        patterns = []
+        for handlers in application.handlers.values():
+            for handler in handlers:
+                patterns.extend(self._patterns(handler))
+        return patterns
+
+    def _patterns(self, handler) -> list:
+        """(имя, шаблон) всех CallbackQueryHandler, кроме самого маршрутизатора"""
+        if isinstance(handler, ConversationHandler):
+            inner = list(handler.entry_points) + list(handler.fallbacks)
+            for state_handlers in handler.states.values():
+                inner.extend(state_handlers)
+            return [pattern for h in inner for pattern in self._patterns(h)]
+        if not isinstance(handler, CallbackQueryHandler) or handler.callback == self.dispatch:
+            return []
+        return [(handler.callback.__name__, handler.pattern)]
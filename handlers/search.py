@@ -0,0 +1,48 @@
+import logging
+from telegram import (
+    Update,
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
+    InlineQueryResultArticle,
+    InputTextMessageContent
+)
+from telegram.ext import CallbackContext
+from storage.search import index as search_index
+from .router import encode
+
+logger = logging.getLogger(__name__)
+MAX_RESULTS = 10
+
+async def search_command(update: Update, context: CallbackContext) -> None:
+    query = " ".join(context.args or [])
+    if not query:
+        await update.message.reply_text("🔎 Введите запрос после команды, например:\n/search приказ о приеме")
+        return
+    
+    items = search_index.search(query, limit=MAX_RESULTS)
+    buttons = [
+        [InlineKeyboardButton(f"{item['name']} - {item['price']}₽", callback_data=encode("item", item['id']))]
+        for item in items
+    ]
+    buttons.append([InlineKeyboardButton("📁 Каталог", callback_data=encode("catalog"))])
+    
+    text = f"🔎 Найдено по запросу «{query}»:" if items else f"🔎 По запросу «{query}» ничего не найдено"
+    await update.message.reply_text(text, reply_markup=InlineKeyboardMarkup(buttons))
+
+async def inline_search(update: Update, context: CallbackContext) -> None:
+    query = update.inline_query.query.strip()
+    items = search_index.search(query, limit=MAX_RESULTS * 5) if query else []
+    
+    results = [
+        InlineQueryResultArticle(
+            id=item["id"],
+            title=item["name"],
+            description=f"{item['price']}₽",
+            input_message_content=InputTextMessageContent(f"📝 {item['name']}\nЦена: {item['price']}₽"),
+            reply_markup=InlineKeyboardMarkup([
+                [InlineKeyboardButton("🛒 Подробнее", callback_data=encode("item", item['id']))]
+            ])
+        )
+        for item in items
+    ]
+    await update.inline_query.answer(results, cache_time=60)
@@ -0,0 +1,195 @@
+import asyncio
+import contextlib
+import json
+import logging
+import multiprocessing
+import signal
+import threading
+from telegram import Update
+from services.concurrency import shard_of, update_owner
+from services.webhook import create_updater
+
+logger = logging.getLogger(__name__)
+
+# Сколько ждать, пока рабочий процесс обработает полученные обновления и остановится
+STOP_TIMEOUT = 60
+# Как часто фронт проверяет, что рабочие процессы живы
+WATCH_INTERVAL = 1.0
+
+# spawn одинаково работает на Linux и Windows и не наследует состояние фронта
+_context = multiprocessing.get_context("spawn")
+
+
+class WorkerHandle:
+    """Рабочий процесс шарда, его очередь обновлений и событие завершения"""
+
+    def __init__(self, target, index: int, count: int, updates=None, wait_for=None):
+        self.index = index
+        # Очередь переходит к процессу, который заменяет этот, вместе с ещё не прочитанными обновлениями
+        self.updates = updates or _context.Queue()
+        self.done = _context.Event()
+        # Событие предыдущего процесса должно жить, пока новый процесс его не получит:
+        # при сборке мусора семафор события удаляется
+        self.wait_for = wait_for
+        self.process = _context.Process(
+            target=target, args=(index, count, self.updates, self.done, wait_for), name=f"worker-{index}"
+        )
+        self.process.start()
+
+
+class Front:
+    """Принимает обновления (webhook или getUpdates) и раздаёт их рабочим процессам.
+
+    Обновления одного пользователя всегда попадают в один процесс и обрабатываются
+    там по очереди, как в однопроцессном режиме. Рабочие процессы делят data/bot.db
+    (корзины, заказы, outbox, состояние диалогов) и data/products.json.
+    SIGHUP перезапускает рабочие процессы по одному: новый процесс начинает читать
+    очередь, когда старый обработал всё полученное, поэтому обновления не теряются.
+    """
+
+    def __init__(self, target, count: int):
+        self.target = target
+        self.count = count
+        self.workers = []
+        self._stopping = False
+        self._restart_lock = asyncio.Lock()
+
+    def dispatch(self, update: Update) -> None:
+        owner = update_owner(update)
+        index = 0 if owner is None else shard_of(owner, self.count)
+        self.workers[index].updates.put(json.dumps(update.to_dict()))
+
+    async def run(self, bot, webhook: dict = None) -> None:
+        """Работает до SIGINT/SIGTERM; webhook - параметры Updater.start_webhook или None для polling"""
+        loop = asyncio.get_running_loop()
+        stop = asyncio.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            with contextlib.suppress(NotImplementedError):
+                loop.add_signal_handler(sig, stop.set)
+        if hasattr(signal, "SIGHUP"):
+            loop.add_signal_handler(signal.SIGHUP, lambda: asyncio.ensure_future(self.restart_all()))
+
+        # Рабочие процессы загружаются, пока запускается приём обновлений
+        self.workers = [WorkerHandle(self.target, index, self.count) for index in range(self.count)]
+        try:
+            update_queue = asyncio.Queue()
+            updater = create_updater(bot, update_queue, webhook)
+            async with updater:
+                if webhook:
+                    await updater.start_webhook(**webhook)
+                else:
+                    await updater.start_polling()
+                forward = asyncio.create_task(self._forward(update_queue), name="front-forward")
+                watch = asyncio.create_task(self._watch(), name="front-watch")
+                logger.info(f"Фронт запущен, рабочих процессов: {self.count}")
+                await stop.wait()
+
+                self._stopping = True
+                await updater.stop()
+                for task in (forward, watch):
+                    task.cancel()
+                    with contextlib.suppress(asyncio.CancelledError):
+                        await task
+                # Уже принятые обновления тоже отдаём рабочим процессам
+                while not update_queue.empty():
+                    self.dispatch(update_queue.get_nowait())
+        finally:
+            # Рабочие процессы игнорируют SIGINT/SIGTERM: если фронт не запустился или упал,
+            # без этого они остались бы работать без фронта
+            self._stopping = True
+            await self._stop_workers()
+
+    async def restart_all(self) -> None:
+        async with self._restart_lock:
+            logger.info("Перезапуск рабочих процессов")
+            for index in range(self.count):
+                if self._stopping:
+                    return
+                await self.restart(index)
+            logger.info("Рабочие процессы перезапущены")
+
+    async def restart(self, index: int) -> None:
+        old = self.workers[index]
+        # Новый процесс загружается сразу, а обновления начинает читать после остановки старого
+        self.workers[index] = WorkerHandle(self.target, index, self.count, old.updates, old.done)
+        old.updates.put(None)
+        await self._join(old)
+
+    async def _forward(self, update_queue: asyncio.Queue) -> None:
+        while True:
+            update = await update_queue.get()
+            try:
+                self.dispatch(update)
+            except Exception as e:
+                logger.error(f"Не удалось передать обновление рабочему процессу: {e}")
+
+    async def _watch(self) -> None:
+        """Заменяет рабочие процессы, завершившиеся без команды фронта"""
+        while True:
+            await asyncio.sleep(WATCH_INTERVAL)
+            if self._restart_lock.locked():
+                continue
+            for index, worker in enumerate(self.workers):
+                if worker.process.is_alive() or worker.done.is_set():
+                    continue
+                logger.error(f"Рабочий процесс {index} завершился (код {worker.process.exitcode}), запускаю заново")
+                worker.done.set()
+                self.workers[index] = WorkerHandle(self.target, index, self.count, worker.updates)
+
+    async def _stop_workers(self) -> None:
+        for worker in self.workers:
+            worker.updates.put(None)
+        await asyncio.gather(*(self._join(worker) for worker in self.workers))
+
+    async def _join(self, worker: WorkerHandle) -> None:
+        await asyncio.get_running_loop().run_in_executor(None, worker.process.join, STOP_TIMEOUT)
+        if worker.process.is_alive():
+            logger.error(f"Рабочий процесс {worker.index} не остановился за {STOP_TIMEOUT} с")
+            # SIGTERM рабочий процесс игнорирует
+            worker.process.kill()
+            await asyncio.get_running_loop().run_in_executor(None, worker.process.join)
+        # Процесс, остановленный принудительно, сам событие не выставит
+        worker.done.set()
+
+
+async def serve(application, updates, done, wait_for=None) -> None:
+    """Рабочий процесс: обрабатывает обновления из очереди фронта до получения None"""
+    # Ctrl+C в терминале и SIGTERM от systemd/docker получает вся группа процессов;
+    # рабочих останавливает фронт через очередь, дав им обработать принятые обновления
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, signal.SIG_IGN)
+    loop = asyncio.get_running_loop()
+    try:
+        if wait_for is not None:
+            # Предыдущий процесс шарда должен обработать свои обновления и сохранить состояние
+            await loop.run_in_executor(None, wait_for.wait)
+        async with application:
+            if application.post_init:
+                await application.post_init(application)
+            await application.start()
+            finished = loop.create_future()
+            threading.Thread(
+                target=_read_updates, args=(updates, loop, application, finished), name="front-updates", daemon=True
+            ).start()
+            await finished
+            # stop() дожидается обработки всего, что уже в update_queue, и сохраняет состояние
+            await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+    finally:
+        done.set()
+
+
+def _read_updates(updates, loop, application, finished) -> None:
+    while True:
+        data = updates.get()
+        if data is None:
+            loop.call_soon_threadsafe(finished.set_result, None)
+            return
+        loop.call_soon_threadsafe(_enqueue, application, data)
+
+
+def _enqueue(application, data: str) -> None:
+    application.update_queue.put_nowait(Update.de_json(json.loads(data), application.bot))
@@ -0,0 +1,92 @@
+import asyncio
+import contextlib
+import logging
+import weakref
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+# Семафор базового класса захватывается до do_process_update, поэтому настоящий
+# лимит применяется внутри: иначе очередь одного пользователя занимала бы все слоты
+_UNBOUNDED = 2 ** 31 - 1
+
+
+def update_owner(update: object):
+    """id пользователя (или чата), чьи обновления должны обрабатываться по очереди"""
+    if isinstance(update, Update):
+        if update.effective_user:
+            return update.effective_user.id
+        if update.effective_chat:
+            return update.effective_chat.id
+    return None
+
+
+def shard_of(owner: int, count: int) -> int:
+    """Номер рабочего процесса, которому принадлежит пользователь или чат.
+    Та же формула повторяется в storage.outbox (в SQL) и storage.persistence"""
+    return abs(owner) % count
+
+
+class UserOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Обрабатывает обновления разных пользователей параллельно (не больше limit
+    одновременно), а обновления одного пользователя - строго по очереди."""
+
+    def __init__(self, limit: int):
+        super().__init__(max_concurrent_updates=_UNBOUNDED)
+        if limit < 1:
+            raise ValueError("limit must be a positive integer")
+        self.limit = limit
+        self._slots = asyncio.Semaphore(limit)
+        self._user_locks = weakref.WeakValueDictionary()
+        self._queued = 0
+        self._in_flight = 0
+
+    @property
+    def queue_depth(self) -> int:
+        """Обновления, ожидающие своей очереди или свободного слота"""
+        return self._queued
+
+    @property
+    def in_flight(self) -> int:
+        """Обновления, которые обрабатываются прямо сейчас"""
+        return self._in_flight
+
+    def stats(self) -> dict:
+        return {"limit": self.limit, "queue_depth": self._queued, "in_flight": self._in_flight}
+
+    def _user_lock(self, update: object):
+        user_id = update_owner(update)
+        if user_id is None:
+            return contextlib.nullcontext()
+
+        user_lock = self._user_locks.get(user_id)
+        if user_lock is None:
+            user_lock = asyncio.Lock()
+            self._user_locks[user_id] = user_lock
+        return user_lock
+
+    async def do_process_update(self, update: object, coroutine) -> None:
+        self._queued += 1
+        started = False
+        try:
+            async with self._user_lock(update):
+                async with self._slots:
+                    self._queued -= 1
+                    self._in_flight += 1
+                    started = True
+                    try:
+                        await coroutine
+                    finally:
+                        self._in_flight -= 1
+        finally:
+            if not started:
+                self._queued -= 1
+                coroutine.close()
+
+    async def initialize(self) -> None:
+        logger.info(f"Параллельная обработка обновлений: до {self.limit} одновременно")
+
+    async def shutdown(self) -> None:
+        if self._queued or self._in_flight:
+            logger.warning(f"Остановка с необработанными обновлениями: {self.stats()}")
@@ -0,0 +1,56 @@
+import logging
+from storage import catalog as catalog_store
+from storage import orders as order_store
+from storage.access import run_io
+from services import outbox
+
+logger = logging.getLogger(__name__)
+
+# Telegram принимает в альбом от 2 до 10 файлов
+MEDIA_GROUP_SIZE = 10
+
+
+def build_delivery(order: dict) -> tuple:
+    """Сообщения с файлами заказа для покупателя и список товаров без файла.
+
+    Если файла нет ни у одного товара, сообщений нет: заказ останется оплаченным,
+    а не доставленным, и файлы отправит админ
+    """
+    file_ids = []
+    missing = []
+    for item in order["items"]:
+        # Берём актуальный файл из каталога, если товар ещё продаётся
+        current = catalog_store.get_item(item["id"]) or item
+        if current.get("file_id"):
+            file_ids.append(current["file_id"])
+        else:
+            missing.append(item["name"])
+
+    if not file_ids:
+        return [], missing
+    chat_id = order["user_id"]
+    messages = [(chat_id, "send_message", {"text": f"✅ Оплата заказа №{order['id']} подтверждена! Ваши файлы:"})]
+    for start in range(0, len(file_ids), MEDIA_GROUP_SIZE):
+        chunk = file_ids[start:start + MEDIA_GROUP_SIZE]
+        if len(chunk) == 1:
+            messages.append((chat_id, "send_document", {"document": chunk[0]}))
+        else:
+            messages.append((chat_id, "send_media_group", {"media": chunk}))
+    return messages, missing
+
+
+async def approve_order(order_id: int):
+    """Подтверждает оплату и ставит доставку файлов в очередь.
+
+    Возвращает (заказ, товары без файла) или None, если заказ не найден или уже подтверждён.
+    """
+    order = await run_io(order_store.get_order, order_id)
+    if not order or order["status"] != "pending":
+        return None
+
+    messages, missing = build_delivery(order)
+    if not await run_io(order_store.approve, order_id, messages):
+        return None
+    outbox.wake()
+    logger.info(f"Заказ №{order_id} подтверждён, сообщений к доставке: {len(messages)}")
+    return order, missing
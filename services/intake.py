@@ -0,0 +1,79 @@
+import time
+from collections import OrderedDict, defaultdict
+from services.sender import TokenBucket
+
+# Сколько последних чеков помнить для отсева повторов
+SEEN_LIMIT = 10000
+# От одного пользователя: до RECEIPT_BURST чеков подряд, дальше один в RECEIPT_INTERVAL секунд
+RECEIPT_BURST = 3
+RECEIPT_INTERVAL = 60
+# Предупреждение о слишком частых чеках отправляется не чаще раза в NOTICE_INTERVAL секунд
+NOTICE_INTERVAL = 60
+# Ведра пользователей, успевшие наполниться, удаляются, когда их становится больше этого числа
+USERS_LIMIT = 10000
+
+ACCEPTED = "accepted"
+DUPLICATE = "duplicate"
+THROTTLED = "throttled"
+
+
+class ReceiptIntake:
+    """Отсев повторных и слишком частых чеков в памяти, до обращения к хранилищу и Bot API"""
+
+    def __init__(self):
+        self._seen = OrderedDict()
+        # user_id -> [ведро токенов, время последнего предупреждения]
+        self._users = {}
+        self.stats = defaultdict(int)
+
+    def check(self, user_id: int, unique_id: str) -> str:
+        """ACCEPTED (чек запоминается), DUPLICATE или THROTTLED"""
+        if unique_id in self._seen:
+            self._seen.move_to_end(unique_id)
+            result = DUPLICATE
+        elif not self._user(user_id)[0].take():
+            result = THROTTLED
+        else:
+            self.remember(unique_id)
+            result = ACCEPTED
+        self.stats[result] += 1
+        return result
+
+    def should_notify(self, user_id: int) -> bool:
+        """Отвечать ли на отклонённый чек: при потоке чеков - один ответ в NOTICE_INTERVAL"""
+        entry = self._user(user_id)
+        now = time.monotonic()
+        if now - entry[1] < NOTICE_INTERVAL:
+            return False
+        entry[1] = now
+        return True
+
+    def remember(self, unique_id: str) -> None:
+        self._seen[unique_id] = True
+        self._seen.move_to_end(unique_id)
+        if len(self._seen) > SEEN_LIMIT:
+            self._seen.popitem(last=False)
+
+    def forget(self, unique_id: str) -> None:
+        """Чек не стал заказом (например, корзина пуста) - его можно прислать снова"""
+        self._seen.pop(unique_id, None)
+
+    def load(self, unique_ids: list) -> None:
+        """Заполняет индекс чеками уже сохранённых заказов (от старых к новым)"""
+        for unique_id in unique_ids:
+            self.remember(unique_id)
+
+    def _user(self, user_id: int) -> list:
+        entry = self._users.get(user_id)
+        if entry is None:
+            if len(self._users) >= USERS_LIMIT:
+                now = time.monotonic()
+                self._users = {
+                    key: value for key, value in self._users.items()
+                    if not value[0].idle(now) or now - value[1] < NOTICE_INTERVAL
+                }
+            entry = self._users[user_id] = [TokenBucket(1 / RECEIPT_INTERVAL, RECEIPT_BURST), float("-inf")]
+        return entry
+
+
+intake = ReceiptIntake()
@@ -0,0 +1,218 @@
+import csv
+import io
+import json
+import posixpath
+import zipfile
+from telegram import InputMediaDocument
+from storage import catalog as catalog_store
+from services.delivery import MEDIA_GROUP_SIZE
+
+# Колонки манифеста; экспорт пишет их в этом же порядке
+FIELDS = ("id", "category", "name", "price", "file", "file_id")
+REQUIRED_FIELDS = ("category", "name", "price")
+# Манифест внутри архива с документами
+MANIFEST_NAMES = ("manifest.csv", "manifest.json")
+MAX_ROWS = 5000
+# Бот может скачать файл до 20 МБ и загрузить документ до 50 МБ
+MAX_DOWNLOAD_SIZE = 20 * 1024 * 1024
+MAX_DOCUMENT_SIZE = 50 * 1024 * 1024
+# Защита от архивов, которые распаковываются в гигабайты
+MAX_UNPACKED_SIZE = 500 * 1024 * 1024
+# id товара попадает в callback_data кнопок ("add:<id>", "remove:<id>"), а она ограничена 64 байтами
+MAX_ID_LENGTH = 40
+
+
+def parse(filename: str, data: bytes) -> tuple:
+    """Разбирает и проверяет манифест (.csv, .json или .zip с манифестом и документами).
+
+    Возвращает (строки, файлы, ошибки). Строки готовы для catalog.import_items, а у строк
+    с документом из архива есть "file" - путь в архиве; файлы - {путь: содержимое}
+    только для упомянутых документов. Если ошибок нет, строк хотя бы одна.
+    """
+    extension = posixpath.splitext(filename.lower())[1]
+    try:
+        if extension == ".zip":
+            return _parse_archive(data)
+        raw_rows = _read_manifest(extension, data)
+    except (ValueError, csv.Error) as e:
+        return [], {}, [str(e)]
+    rows, errors = _validate(raw_rows, None)
+    return rows, {}, errors
+
+
+def _parse_archive(data: bytes) -> tuple:
+    try:
+        archive = zipfile.ZipFile(io.BytesIO(data))
+    except zipfile.BadZipFile:
+        raise ValueError("Архив повреждён или это не ZIP")
+    with archive:
+        members = {posixpath.normpath(info.filename): info for info in archive.infolist() if not info.is_dir()}
+        # Манифест ближе всего к корню архива; пути к документам считаются от его папки
+        manifests = sorted(
+            (path for path in members if posixpath.basename(path).lower() in MANIFEST_NAMES),
+            key=lambda path: path.count("/")
+        )
+        if not manifests:
+            raise ValueError(f"В архиве нет манифеста ({' или '.join(MANIFEST_NAMES)})")
+        manifest_path = manifests[0]
+        base = posixpath.dirname(manifest_path)
+        raw_rows = _read_manifest(posixpath.splitext(manifest_path.lower())[1], archive.read(members[manifest_path]))
+
+        documents = {}
+        for path, info in members.items():
+            relative = posixpath.relpath(path, base) if base else path
+            if path != manifest_path and not relative.startswith("../"):
+                documents[relative] = info
+        rows, errors = _validate(raw_rows, documents)
+        if errors:
+            return rows, {}, errors
+
+        needed = {row["file"] for row in rows if row.get("file")}
+        unpacked = sum(documents[path].file_size for path in needed)
+        if unpacked > MAX_UNPACKED_SIZE:
+            return rows, {}, [f"Документы занимают {unpacked // (1024 * 1024)} МБ, допустимо не больше {MAX_UNPACKED_SIZE // (1024 * 1024)} МБ"]
+        files = {path: archive.read(documents[path]) for path in needed}
+    return rows, files, []
+
+
+def _read_manifest(extension: str, data: bytes) -> list:
+    """Строки манифеста как словари (номер строки, поля) без проверки значений"""
+    try:
+        text = data.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        raise ValueError("Манифест должен быть в кодировке UTF-8")
+
+    if extension == ".csv":
+        # Excel с русской локалью сохраняет CSV через точку с запятой
+        first_line = text.split("\n", 1)[0]
+        delimiter = ";" if first_line.count(";") > first_line.count(",") else ","
+        reader = csv.DictReader(io.StringIO(text), delimiter=delimiter)
+        if reader.fieldnames is None:
+            raise ValueError("Манифест пуст")
+        reader.fieldnames = [name.strip().lower() for name in reader.fieldnames]
+        missing = [field for field in REQUIRED_FIELDS if field not in reader.fieldnames]
+        if missing:
+            raise ValueError(f"В манифесте нет колонок: {', '.join(missing)}")
+        # Первая строка файла - заголовок
+        return [(reader.line_num, row) for row in reader]
+
+    if extension == ".json":
+        try:
+            content = json.loads(text)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Ошибка в JSON: {e}")
+        if isinstance(content, dict) and isinstance(content.get("categories"), list):
+            # Формат products.json (например, экспорт /export json)
+            content = [
+                dict(item, category=category.get("name", ""))
+                for category in content["categories"]
+                for item in category.get("items", [])
+            ]
+        if not isinstance(content, list) or not all(isinstance(row, dict) for row in content):
+            raise ValueError("JSON-манифест должен быть списком товаров или каталогом в формате products.json")
+        return list(enumerate(content, start=1))
+
+    raise ValueError("Поддерживаются манифесты .csv и .json или архив .zip с манифестом и документами")
+
+
+def _validate(raw_rows: list, documents) -> tuple:
+    """Проверяет строки целиком до любых изменений; documents - файлы архива или None"""
+    if not raw_rows:
+        return [], ["В манифесте нет товаров"]
+    if len(raw_rows) > MAX_ROWS:
+        return [], [f"В манифесте {len(raw_rows)} товаров, за один раз можно загрузить не больше {MAX_ROWS}"]
+
+    products = catalog_store.get_products()
+    existing_names = {
+        (catalog_store.name_key(category["name"]), catalog_store.name_key(item["name"]))
+        for category in products["categories"]
+        for item in category["items"]
+    }
+    rows = []
+    errors = []
+    seen_ids = set()
+    seen_names = set()
+    for line, raw in raw_rows:
+        values = {field: str(raw.get(field) or "").strip() for field in FIELDS}
+        problems = []
+        if not values["category"]:
+            problems.append("не указана категория")
+        if not values["name"]:
+            problems.append("не указано название")
+        try:
+            price = int(values["price"])
+            if price <= 0:
+                raise ValueError
+        except ValueError:
+            problems.append(f"цена должна быть целым положительным числом, а не '{values['price']}'")
+            price = None
+
+        item_id = values["id"]
+        if item_id:
+            if ":" in item_id or len(item_id) > MAX_ID_LENGTH:
+                problems.append(f"id должен быть не длиннее {MAX_ID_LENGTH} символов и без ':'")
+            elif item_id in seen_ids:
+                problems.append(f"id {item_id} повторяется")
+            seen_ids.add(item_id)
+        key = (catalog_store.name_key(values["category"]), catalog_store.name_key(values["name"]))
+        if not item_id and key in seen_names:
+            problems.append("товар с таким названием в этой категории уже есть выше")
+        seen_names.add(key)
+
+        path = values["file"]
+        if path:
+            if documents is None:
+                problems.append("колонка file работает только в ZIP-архиве с документами")
+            else:
+                path = posixpath.normpath(path.replace("\\", "/"))
+                if path not in documents:
+                    problems.append(f"файл {values['file']} не найден в архиве")
+                elif documents[path].file_size > MAX_DOCUMENT_SIZE:
+                    problems.append(f"файл {values['file']} больше 50 МБ")
+        exists = catalog_store.get_item(item_id) if item_id else key in existing_names
+        if not path and not values["file_id"] and not exists:
+            problems.append("у нового товара нет файла (file или file_id)")
+
+        if problems:
+            errors.append(f"Строка {line}: " + "; ".join(problems))
+            continue
+        row = {"id": item_id, "category": values["category"], "name": values["name"], "price": price, "file_id": values["file_id"]}
+        if path:
+            row["file"] = path
+        rows.append(row)
+    return rows, errors
+
+
+async def upload_files(bot, chat_id: int, files: dict) -> dict:
+    """Загружает документы в чат альбомами и возвращает {путь: file_id}"""
+    paths = sorted(files)
+    file_ids = {}
+    for start in range(0, len(paths), MEDIA_GROUP_SIZE):
+        chunk = paths[start:start + MEDIA_GROUP_SIZE]
+        if len(chunk) == 1:
+            messages = [await bot.send_document(
+                chat_id, files[chunk[0]], filename=posixpath.basename(chunk[0]), disable_notification=True
+            )]
+        else:
+            messages = await bot.send_media_group(chat_id, [
+                InputMediaDocument(files[path], filename=posixpath.basename(path)) for path in chunk
+            ], disable_notification=True)
+        for path, message in zip(chunk, messages):
+            file_ids[path] = message.document.file_id
+    return file_ids
+
+
+def export_csv() -> bytes:
+    """Каталог в формате CSV-манифеста; повторный импорт файла ничего не меняет"""
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(FIELDS)
+    for category in catalog_store.get_products()["categories"]:
+        for item in category["items"]:
+            writer.writerow((item["id"], category["name"], item["name"], item["price"], "", item.get("file_id", "")))
+    # BOM нужен, чтобы Excel правильно открыл кириллицу
+    return output.getvalue().encode('utf-8-sig')
+
+
+def export_json() -> bytes:
+    return json.dumps(catalog_store.get_products(), ensure_ascii=False, indent=2).encode('utf-8')
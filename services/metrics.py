@@ -0,0 +1,272 @@
+import asyncio
+import bisect
+import contextvars
+import functools
+import logging
+import time
+from collections import defaultdict
+from telegram.ext import ConversationHandler
+from telegram.request import HTTPXRequest
+from services.intake import intake as receipt_intake
+from storage import access
+
+logger = logging.getLogger(__name__)
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Гистограмма в духе Prometheus: накопительные корзины, сумма и количество по меткам"""
+
+    def __init__(self, name: str, help_text: str, label: str):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self._series = defaultdict(lambda: [[0] * (len(BUCKETS) + 1), 0.0])
+
+    def observe(self, label_value: str, seconds: float) -> None:
+        counts, _ = series = self._series[label_value]
+        counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        series[1] += seconds
+
+    def summary(self) -> dict:
+        return {key: (sum(counts), total) for key, (counts, total) in self._series.items()}
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(BUCKETS, counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{self.label}="{key}",le="{bound}"}} {cumulative}')
+            cumulative += counts[-1]
+            lines.append(f'{self.name}_bucket{{{self.label}="{key}",le="+Inf"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{self.label}="{key}"}} {total:.6f}')
+            lines.append(f'{self.name}_count{{{self.label}="{key}"}} {cumulative}')
+        return lines
+
+
+class _Timing:
+    """Время хранилища и Bot API внутри одного вызова обработчика"""
+    __slots__ = ("storage", "api")
+
+    def __init__(self):
+        self.storage = 0.0
+        self.api = 0.0
+
+
+_current = contextvars.ContextVar("handler_timing", default=None)
+
+handler_seconds = Histogram("bot_handler_seconds", "Полное время обработчика", "handler")
+handler_storage_seconds = Histogram("bot_handler_storage_seconds", "Время хранилища внутри обработчика", "handler")
+handler_api_seconds = Histogram("bot_handler_api_seconds", "Время вызовов Bot API внутри обработчика", "handler")
+storage_seconds = Histogram("bot_storage_call_seconds", "Время вызовов хранилища", "call")
+api_seconds = Histogram("bot_api_request_seconds", "Время запросов к Bot API", "method")
+file_operations = defaultdict(int)
+file_bytes = defaultdict(int)
+handler_errors = defaultdict(int)
+
+
+class _StorageObserver:
+    """Подключается к storage.access и учитывает время хранилища и файловый ввод/вывод"""
+
+    def storage_call(self, name: str, seconds: float) -> None:
+        storage_seconds.observe(name, seconds)
+        timing = _current.get()
+        if timing is not None:
+            timing.storage += seconds
+
+    def file_io(self, operation: str, size: int) -> None:
+        file_operations[operation] += 1
+        file_bytes[operation] += size
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest, замеряющий каждый запрос к Bot API"""
+
+    async def do_request(self, url, method, request_data=None, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await super().do_request(url, method, request_data, *args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - started
+            api_seconds.observe(url.rsplit('/', 1)[-1], seconds)
+            timing = _current.get()
+            if timing is not None:
+                timing.api += seconds
+
+
+def _timed(callback, label: str):
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        timing = _Timing()
+        token = _current.set(timing)
+        started = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception:
+            handler_errors[label] += 1
+            raise
+        finally:
+            _current.reset(token)
+            handler_seconds.observe(label, time.perf_counter() - started)
+            handler_storage_seconds.observe(label, timing.storage)
+            handler_api_seconds.observe(label, timing.api)
+    return wrapper
+
+
+def _label(callback) -> str:
+    module = callback.__module__.rsplit('.', 1)[-1]
+    return f"{module}.{callback.__name__}"
+
+
+def _instrument_handler(handler) -> None:
+    if isinstance(handler, ConversationHandler):
+        for inner in handler.entry_points + handler.fallbacks:
+            _instrument_handler(inner)
+        for state_handlers in handler.states.values():
+            for inner in state_handlers:
+                _instrument_handler(inner)
+        return
+    callback = handler.callback
+    router = getattr(callback, '__self__', None)
+    if isinstance(getattr(router, 'routes', None), dict):
+        # Маршрутизатор кнопок (handlers.router): замеряем каждый обработчик отдельно
+        router.routes = {action: _timed(route, _label(route)) for action, route in router.routes.items()}
+        return
+    handler.callback = _timed(callback, _label(callback))
+
+
+def instrument(application) -> None:
+    """Оборачивает обработчики приложения замерами и включает учёт хранилища.
+
+    Вызывается после регистрации обработчиков; без вызова метрики ничего не стоят.
+    """
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            _instrument_handler(handler)
+    access.observer = _StorageObserver()
+
+
+def render(application=None) -> str:
+    lines = []
+    for histogram in (handler_seconds, handler_storage_seconds, handler_api_seconds, storage_seconds, api_seconds):
+        lines.extend(histogram.render())
+
+    lines.append("# HELP bot_handler_errors_total Исключения в обработчиках")
+    lines.append("# TYPE bot_handler_errors_total counter")
+    for label, count in sorted(handler_errors.items()):
+        lines.append(f'bot_handler_errors_total{{handler="{label}"}} {count}')
+
+    lines.append("# HELP bot_file_operations_total Чтения и записи JSON-файлов данных")
+    lines.append("# TYPE bot_file_operations_total counter")
+    for operation, count in sorted(file_operations.items()):
+        lines.append(f'bot_file_operations_total{{op="{operation}"}} {count}')
+    lines.append("# HELP bot_file_bytes_total Прочитано и записано байт JSON-файлов данных")
+    lines.append("# TYPE bot_file_bytes_total counter")
+    for operation, size in sorted(file_bytes.items()):
+        lines.append(f'bot_file_bytes_total{{op="{operation}"}} {size}')
+
+    lines.append("# HELP bot_receipts_total Присланные чеки: приняты, повторы, отклонены из-за частоты")
+    lines.append("# TYPE bot_receipts_total counter")
+    for result, count in sorted(receipt_intake.stats.items()):
+        lines.append(f'bot_receipts_total{{result="{result}"}} {count}')
+
+    sender = application.bot.rate_limiter if application else None
+    if hasattr(sender, "stats"):
+        lines.append("# HELP bot_sender_events_total Запросы к Bot API, задержанные, склеенные или отброшенные отправителем")
+        lines.append("# TYPE bot_sender_events_total counter")
+        for event, count in sorted(sender.stats.items()):
+            lines.append(f'bot_sender_events_total{{event="{event}"}} {count}')
+
+    processor = application.update_processor if application else None
+    if hasattr(processor, "stats"):
+        stats = processor.stats()
+        lines.append("# TYPE bot_updates_queued gauge")
+        lines.append(f"bot_updates_queued {stats['queue_depth']}")
+        lines.append("# TYPE bot_updates_in_flight gauge")
+        lines.append(f"bot_updates_in_flight {stats['in_flight']}")
+    return "\n".join(lines) + "\n"
+
+
+def summary() -> str:
+    parts = []
+    storage = handler_storage_seconds.summary()
+    api = handler_api_seconds.summary()
+    for label, (count, total) in sorted(handler_seconds.summary().items()):
+        parts.append(
+            f"{label}: {count} шт, в среднем {total / count * 1000:.1f} мс "
+            f"(хранилище {storage[label][1] / count * 1000:.1f}, API {api[label][1] / count * 1000:.1f})"
+        )
+    parts.append(
+        f"файлы: чтений {file_operations['read']} ({file_bytes['read']} Б), "
+        f"записей {file_operations['write']} ({file_bytes['write']} Б)"
+    )
+    return "\n".join(parts)
+
+
+class MetricsServer:
+    """HTTP-эндпоинт /metrics в текстовом формате Prometheus и периодическая сводка в лог"""
+
+    def __init__(self, application, host: str, port: int, log_interval: int):
+        self.application = application
+        self.host = host
+        self.port = port
+        self.log_interval = log_interval
+        self._server = None
+        self._log_task = None
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        logger.info(f"Метрики доступны на http://{self.host}:{self.port}/metrics")
+        if self.log_interval:
+            self._log_task = asyncio.create_task(self._log_summary(), name="metrics-log")
+
+    async def stop(self) -> None:
+        if self._log_task:
+            self._log_task.cancel()
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _handle(self, reader, writer) -> None:
+        try:
+            request_line = await reader.readline()
+            # Заголовки запроса не нужны, но их надо дочитать
+            while (await reader.readline()).strip():
+                pass
+            parts = request_line.decode('latin-1').split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split('?')[0] == "/metrics":
+                status, body = "200 OK", render(self.application).encode('utf-8')
+            else:
+                status, body = "404 Not Found", b"not found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: close\r\n\r\n".encode('latin-1') + body
+            )
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _log_summary(self) -> None:
+        while True:
+            await asyncio.sleep(self.log_interval)
+            logger.info("Сводка метрик:\n" + summary())
+
+
+_server = None
+
+
+async def start(application, host: str, port: int, log_interval: int) -> None:
+    global _server
+    _server = MetricsServer(application, host, port, log_interval)
+    await _server.start()
+
+
+async def stop() -> None:
+    if _server:
+        await _server.stop()
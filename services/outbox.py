@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import time
+from telegram import InlineKeyboardMarkup, InputMediaDocument
+from telegram.error import BadRequest, Forbidden, RetryAfter
+from config import ADMIN_ID
+from storage import orders as order_store
+from storage import outbox as outbox_store
+from storage.access import run_io
+
+logger = logging.getLogger(__name__)
+
+ALLOWED_METHODS = {"send_message", "send_photo", "send_document", "send_media_group"}
+# Скорость отправки ограничивает services.sender, через который идут все запросы бота
+MAX_ATTEMPTS = 8
+MAX_BACKOFF = 300
+IDLE_POLL = 5.0
+# В многопроцессном режиме сообщение в чужой чат будит только опрос базы
+SHARDED_IDLE_POLL = 1.0
+
+
+class OutboxWorker:
+    """Фоновая задача, отправляющая сообщения из очереди outbox с повторами и ограничением скорости"""
+
+    def __init__(self, bot, shard: tuple = None):
+        self.bot = bot
+        self.shard = shard
+        self.idle_poll = IDLE_POLL if shard is None else SHARDED_IDLE_POLL
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run(), name="outbox")
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def wake(self) -> None:
+        self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                messages = await run_io(outbox_store.fetch_due, shard=self.shard)
+                for message in messages:
+                    await self._send(message)
+                if messages:
+                    continue
+                next_at = await run_io(outbox_store.next_attempt_at, self.shard)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка обработки очереди сообщений: {e}")
+                next_at = None
+
+            timeout = self.idle_poll if next_at is None else min(max(next_at - time.time(), 0), self.idle_poll)
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _send(self, message: dict) -> None:
+        if message["method"] not in ALLOWED_METHODS:
+            await run_io(outbox_store.mark_failed, message["id"], f"unknown method {message['method']}")
+            return
+
+        payload = dict(message["payload"])
+        if message["method"] == "send_media_group":
+            payload["media"] = [InputMediaDocument(file_id) for file_id in payload["media"]]
+        if "reply_markup" in payload:
+            payload["reply_markup"] = InlineKeyboardMarkup.de_json(payload["reply_markup"], self.bot)
+
+        try:
+            await getattr(self.bot, message["method"])(chat_id=message["chat_id"], **payload)
+        except RetryAfter as e:
+            retry_after = e.retry_after.total_seconds() if hasattr(e.retry_after, "total_seconds") else e.retry_after
+            logger.warning(f"Telegram просит подождать {retry_after} с перед отправкой")
+            await run_io(outbox_store.reschedule, message["id"], retry_after, str(e))
+        except (BadRequest, Forbidden) as e:
+            # Повтор не поможет: чат недоступен или запрос некорректен
+            logger.error(f"Сообщение {message['id']} не может быть отправлено: {e}")
+            await self._fail(message, str(e))
+        except Exception as e:
+            attempts = message["attempts"] + 1
+            if attempts >= MAX_ATTEMPTS:
+                logger.error(f"Сообщение {message['id']} не отправлено после {attempts} попыток: {e}")
+                await self._fail(message, str(e))
+            else:
+                delay = min(2 ** attempts, MAX_BACKOFF)
+                logger.warning(f"Ошибка отправки сообщения {message['id']}, повтор через {delay} с: {e}")
+                await run_io(outbox_store.reschedule, message["id"], delay, str(e))
+        else:
+            await run_io(outbox_store.mark_sent, message["id"])
+            if message["order_id"] and await run_io(order_store.mark_delivered_if_complete, message["order_id"]):
+                logger.info(f"Заказ №{message['order_id']} доставлен")
+
+    async def _fail(self, message: dict, error: str) -> None:
+        await run_io(outbox_store.mark_failed, message["id"], error)
+        if message["order_id"]:
+            # Файлы заказа не дошли до покупателя - админу нужно вмешаться
+            await run_io(outbox_store.enqueue, [(ADMIN_ID, "send_message", {"text": (
+                f"⚠️ Не удалось доставить файлы заказа №{message['order_id']} "
+                f"пользователю {message['chat_id']}: {error}"
+            )})])
+
+
+_worker = None
+
+
+def start(bot, shard: tuple = None) -> None:
+    global _worker
+    _worker = OutboxWorker(bot, shard)
+    _worker.start()
+
+
+async def stop() -> None:
+    if _worker:
+        await _worker.stop()
+
+
+def wake() -> None:
+    if _worker:
+        _worker.wake()
@@ -0,0 +1,59 @@
+import threading
+from collections import OrderedDict
+from storage import catalog as catalog_store
+
+# Сколько рассчитанных корзин держать в памяти
+CACHE_SIZE = 10000
+
+_cache = OrderedDict()
+_cache_version = None
+_lock = threading.Lock()
+
+
+def price_cart(user_id: int, cart: dict) -> dict:
+    """Расчёт корзины {id товара: количество} по текущему каталогу.
+
+    Возвращает {"lines": [...], "total": ..., "missing": [...]}, где строки содержат
+    id, name, price, quantity, sum и file_id, а missing - id товаров, которых больше нет
+    в каталоге. Результат кэшируется до смены корзины или версии каталога; не изменять.
+    """
+    global _cache_version
+    key = tuple(sorted(cart.items()))
+    version = catalog_store.get_version()
+    with _lock:
+        if version != _cache_version:
+            # Каталог изменился: цены и названия могли стать другими
+            _cache.clear()
+            _cache_version = version
+        cached = _cache.get(user_id)
+        if cached is not None and cached[0] == key:
+            _cache.move_to_end(user_id)
+            return cached[1]
+
+    priced = _price(cart, catalog_store.get_items())
+    with _lock:
+        if version == _cache_version:
+            _cache[user_id] = (key, priced)
+            _cache.move_to_end(user_id)
+            if len(_cache) > CACHE_SIZE:
+                _cache.popitem(last=False)
+    return priced
+
+
+def _price(cart: dict, items: dict) -> dict:
+    lines = []
+    missing = []
+    for item_id, quantity in cart.items():
+        item = items.get(item_id)
+        if item is None:
+            missing.append(item_id)
+            continue
+        lines.append({
+            "id": item_id,
+            "name": item["name"],
+            "price": item["price"],
+            "quantity": quantity,
+            "sum": item["price"] * quantity,
+            "file_id": item.get("file_id", "")
+        })
+    return {"lines": lines, "total": sum(line["sum"] for line in lines), "missing": missing}
@@ -0,0 +1,257 @@
+import asyncio
+import contextvars
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict, defaultdict
+from telegram.error import BadRequest, RetryAfter
+from telegram.ext import BaseRateLimiter
+
+logger = logging.getLogger(__name__)
+
+# Telegram допускает около 30 сообщений в секунду всего, около одного в секунду в личный чат
+# и 20 в минуту в группу; короткие всплески в пределах ёмкости ведра проходят без ожидания
+GLOBAL_RATE = 30
+GLOBAL_BURST = 30
+CHAT_RATE = 1.0
+CHAT_BURST = 5
+GROUP_RATE = 20 / 60
+GROUP_BURST = 3
+# Сколько раз повторять запрос после ответа 429 (RetryAfter)
+MAX_RETRIES = 3
+# Сколько последних ответов на нажатия кнопок помнить для отбрасывания повторных
+ANSWERED_LIMIT = 4096
+# Ведра чатов, простаивающих дольше, удаляются, когда их становится больше этого числа
+CHAT_BUCKETS_LIMIT = 10000
+# Сколько сообщений помнить в кэше показанного содержимого (около 100 байт на сообщение)
+RENDER_CACHE_SIZE = 20000
+
+# Запросы без побочных эффектов сверх результата: одинаковые одновременные вызовы
+# можно выполнить один раз и раздать результат всем
+COALESCED_ENDPOINTS = {"editMessageText", "editMessageReplyMarkup", "editMessageCaption"}
+# Ответы на нажатия и служебные запросы не расходуют лимит сообщений
+UNLIMITED_ENDPOINTS = {"answerCallbackQuery", "getMe", "getFile", "setWebhook", "deleteWebhook"}
+# Запросы, меняющие содержимое уже отправленного сообщения, и поля, из которых оно состоит
+EDIT_ENDPOINTS = {"editMessageText", "editMessageCaption", "editMessageReplyMarkup"}
+CONTENT_FIELDS = ("text", "caption", "reply_markup", "parse_mode", "entities", "caption_entities", "link_preview_options")
+
+# Нажатие кнопки, которое сейчас обрабатывается (выставляет handlers.router)
+current_query = contextvars.ContextVar("current_query", default=None)
+
+
+class TokenBucket:
+    """Ведро токенов: rate токенов в секунду, не больше capacity"""
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float = 1) -> float:
+        """Забирает токены (можно в долг) и возвращает, сколько секунд ждать их накопления"""
+        self._refill()
+        self.tokens -= amount
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def take(self, amount: float = 1) -> bool:
+        """Забирает токены, только если они уже есть"""
+        self._refill()
+        if self.tokens < amount:
+            return False
+        self.tokens -= amount
+        return True
+
+    def idle(self, now: float) -> bool:
+        return self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+
+class RenderCache:
+    """LRU (chat_id, message_id) -> хэш последнего показанного текста и клавиатуры"""
+
+    def __init__(self, limit: int = RENDER_CACHE_SIZE):
+        self.limit = limit
+        self._hashes = OrderedDict()
+
+    def get(self, key: tuple):
+        digest = self._hashes.get(key)
+        if digest is not None:
+            self._hashes.move_to_end(key)
+        return digest
+
+    def put(self, key: tuple, digest: bytes) -> None:
+        self._hashes[key] = digest
+        self._hashes.move_to_end(key)
+        if len(self._hashes) > self.limit:
+            self._hashes.popitem(last=False)
+
+    def forget(self, key: tuple) -> None:
+        self._hashes.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+
+class OutboundSender(BaseRateLimiter):
+    """Все запросы бота к Bot API проходят здесь (ApplicationBuilder.rate_limiter).
+
+    Ограничивает скорость общим ведром и ведром чата, выжидает retry_after при 429,
+    отбрасывает повторные ответы на одно нажатие и склеивает одинаковые запросы,
+    выполняющиеся одновременно. Правка, которая оставила бы сообщение прежним,
+    не отправляется: на нажатие отвечают только query.answer().
+
+    share - доля общего лимита бота у этого процесса (в многопроцессном режиме 1/N);
+    лимиты чатов не делятся, потому что каждый чат обслуживает один процесс.
+    """
+
+    def __init__(self, share: float = 1.0):
+        self._global = TokenBucket(GLOBAL_RATE * share, max(GLOBAL_BURST * share, 1))
+        self._chats = {}
+        self._paused_until = 0.0
+        self._answered = OrderedDict()
+        self._in_flight = {}
+        self.renders = RenderCache()
+        self.stats = defaultdict(int)
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        if endpoint == "answerCallbackQuery":
+            query_id = data.get("callback_query_id")
+            if query_id in self._answered:
+                # На нажатие уже ответили: Telegram отклонил бы второй ответ
+                self.stats["duplicate_answers"] += 1
+                return True
+            self._remember_answer(query_id)
+
+        message_key = _message_key(endpoint, data)
+        if message_key is not None and self.renders.get(message_key) == _content_hash(data):
+            self.stats["unchanged_edits"] += 1
+            await self._answer_current_query()
+            return True
+
+        key = _coalesce_key(endpoint, data)
+        if key is None:
+            return await self._send(callback, args, kwargs, endpoint, data)
+
+        shared = self._in_flight.get(key)
+        if shared is not None:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(shared)
+
+        future = asyncio.ensure_future(self._send(callback, args, kwargs, endpoint, data))
+        self._in_flight[key] = future
+        future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        return await asyncio.shield(future)
+
+    async def _send(self, callback, args, kwargs, endpoint, data):
+        for attempt in range(MAX_RETRIES + 1):
+            await self._wait(endpoint, data)
+            try:
+                result = await callback(*args, **kwargs)
+            except RetryAfter as e:
+                retry_after = e.retry_after.total_seconds() if hasattr(e.retry_after, "total_seconds") else e.retry_after
+                self.stats["retry_after"] += 1
+                if attempt == MAX_RETRIES:
+                    raise
+                logger.warning(f"Telegram просит подождать {retry_after} с ({endpoint}), попытка {attempt + 1}")
+                # 429 означает превышение общего лимита: ждут все запросы, а не только этот
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+            except BadRequest as e:
+                if "message is not modified" in str(e).lower():
+                    # Содержимое уже такое: для вызывающего это успех, а не ошибка
+                    self.stats["not_modified"] += 1
+                    self._remember_render(endpoint, data, True)
+                    return True
+                self._forget_render(endpoint, data)
+                raise
+            except Exception:
+                # Ответ на нажатие не дошёл (сеть) - повторный ответ отбрасывать нельзя
+                if endpoint == "answerCallbackQuery":
+                    self._answered.pop(data.get("callback_query_id"), None)
+                self._forget_render(endpoint, data)
+                raise
+            else:
+                self._remember_render(endpoint, data, result)
+                return result
+
+    async def _wait(self, endpoint: str, data: dict) -> None:
+        delay = self._paused_until - time.monotonic()
+        if endpoint not in UNLIMITED_ENDPOINTS:
+            # Альбом из N файлов Telegram считает как N сообщений
+            weight = len(data.get("media") or ()) or 1
+            delay = max(delay, self._global.reserve(weight))
+            chat_id = data.get("chat_id")
+            if chat_id is not None:
+                delay = max(delay, self._chat_bucket(chat_id).reserve(weight))
+        if delay > 0:
+            self.stats["throttled"] += 1
+            await asyncio.sleep(delay)
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= CHAT_BUCKETS_LIMIT:
+                now = time.monotonic()
+                self._chats = {key: value for key, value in self._chats.items() if not value.idle(now)}
+            group = isinstance(chat_id, str) or int(chat_id) < 0
+            bucket = TokenBucket(GROUP_RATE, GROUP_BURST) if group else TokenBucket(CHAT_RATE, CHAT_BURST)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    def _remember_render(self, endpoint: str, data: dict, result) -> None:
+        key = _message_key(endpoint, data)
+        if key is None and endpoint == "sendMessage" and isinstance(result, dict):
+            # Новое сообщение тоже запоминаем: следующая правка может его не менять
+            key = (result["chat"]["id"], result["message_id"])
+        if key is not None:
+            self.renders.put(key, _content_hash(data))
+
+    def _forget_render(self, endpoint: str, data: dict) -> None:
+        # После неудачной правки содержимое сообщения неизвестно
+        key = _message_key(endpoint, data)
+        if key is not None:
+            self.renders.forget(key)
+
+    async def _answer_current_query(self) -> None:
+        query = current_query.get()
+        if query is not None and query.id not in self._answered:
+            await query.answer()
+
+    def _remember_answer(self, query_id) -> None:
+        self._answered[query_id] = True
+        if len(self._answered) > ANSWERED_LIMIT:
+            self._answered.popitem(last=False)
+
+
+def _coalesce_key(endpoint: str, data: dict):
+    if endpoint not in COALESCED_ENDPOINTS:
+        return None
+    return endpoint, json.dumps(data, sort_keys=True, default=_serialize)
+
+
+def _message_key(endpoint: str, data: dict):
+    # Сообщения inline-режима (inline_message_id) не кэшируются
+    if endpoint not in EDIT_ENDPOINTS or data.get("message_id") is None:
+        return None
+    return data.get("chat_id"), data["message_id"]
+
+
+def _content_hash(data: dict) -> bytes:
+    content = {field: data[field] for field in CONTENT_FIELDS if data.get(field) is not None}
+    return hashlib.blake2b(json.dumps(content, sort_keys=True, default=_serialize).encode('utf-8'), digest_size=8).digest()
+
+
+def _serialize(value):
+    return value.to_dict() if hasattr(value, "to_dict") else str(value)
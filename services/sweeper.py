@@ -0,0 +1,89 @@
+import datetime
+import logging
+import time
+from config import ADMIN_ID
+from handlers.router import encode
+from services import outbox
+from storage import carts as cart_store
+from storage import db
+from storage import orders as order_store
+from storage.access import run_io
+
+logger = logging.getLogger(__name__)
+
+# Первый запуск - после прогрева и первых обновлений
+FIRST_DELAY = 60
+# Порций за один запуск; если работы больше, остаток достанется следующему запуску
+MAX_BATCHES = 20
+# Свободных страниц базы, возвращаемых системе за запуск (страница - 4 КБ)
+VACUUM_PAGES = 1000
+# Заказов в одном напоминании (сообщение Telegram ограничено 4096 символами)
+REMINDER_ORDERS = 20
+
+
+def start(job_queue, settings: dict) -> None:
+    """Ставит уборку в JobQueue приложения; settings - config.SWEEPER"""
+    if job_queue is None:
+        logger.warning("JobQueue недоступна (нужен python-telegram-bot[job-queue]), фоновая уборка отключена")
+        return
+    job_queue.run_repeating(sweep, interval=settings["interval"], first=FIRST_DELAY, name="sweeper", data=settings)
+
+
+async def sweep(context) -> None:
+    """Одна уборка. Каждая порция - отдельный вызов в пуле потоков хранилища,
+    между ними цикл событий обрабатывает обновления"""
+    settings = context.job.data
+    started = time.perf_counter()
+    try:
+        evicted = await _evict_carts(time.time() - settings["cart_ttl_days"] * 86400, settings["batch_size"])
+        reminded = await _remind_pending(settings["pending_alert_hours"], settings["batch_size"])
+        await run_io(db.compact, VACUUM_PAGES)
+    except Exception as e:
+        logger.error(f"Ошибка фоновой уборки: {e}")
+        return
+    if evicted or reminded:
+        logger.info(
+            f"Уборка за {time.perf_counter() - started:.2f} с: удалено корзин {evicted}, "
+            f"напоминаний о заказах {reminded}"
+        )
+
+
+async def _evict_carts(before: float, batch_size: int) -> int:
+    storage = cart_store.get_storage()
+    total = 0
+    for _ in range(MAX_BATCHES):
+        evicted = await run_io(storage.evict, before, batch_size)
+        total += evicted
+        if evicted < batch_size:
+            break
+    return total
+
+
+async def _remind_pending(hours: int, batch_size: int) -> int:
+    # Даты заказов хранятся строкой "ГГГГ-ММ-ДД ЧЧ:ММ" по местному времени
+    before = (datetime.datetime.now() - datetime.timedelta(hours=hours)).strftime("%Y-%m-%d %H:%M")
+    total = 0
+    for _ in range(MAX_BATCHES):
+        orders = await run_io(order_store.stale_pending, before, batch_size)
+        if not orders:
+            break
+        messages = [
+            _reminder(orders[start:start + REMINDER_ORDERS], hours)
+            for start in range(0, len(orders), REMINDER_ORDERS)
+        ]
+        await run_io(order_store.mark_reminded, [order["id"] for order in orders], messages)
+        total += len(orders)
+        if len(orders) < batch_size:
+            break
+    if total:
+        outbox.wake()
+    return total
+
+
+def _reminder(orders: list, hours: int) -> tuple:
+    text = f"⏰ Заказы ждут подтверждения дольше {hours} ч:\n\n"
+    for order in orders:
+        text += f"🧾 №{order['id']} от {order.get('date') or 'N/A'}, {order.get('username', 'Unknown')}, {order.get('total', 0)}₽\n"
+    return (ADMIN_ID, "send_message", {"text": text, "reply_markup": {"inline_keyboard": [[
+        {"text": "📝 Ожидающие заказы", "callback_data": encode("orders", "pending", "older", 0)}
+    ]]}})
@@ -0,0 +1,20 @@
+from telegram.ext import Updater
+
+
+class LocalWebhookUpdater(Updater):
+    """Принимает обновления на встроенном HTTP-сервере, не вызывая setWebhook/deleteWebhook.
+
+    Без адреса PTB сам составляет его из listen и port (например, http://0.0.0.0:8443/...)
+    и регистрирует у Telegram, а тот такой адрес отклоняет. Для локальной отладки
+    (WEBHOOK["url"] пуст, обновления присылает tools/post_update.py) регистрация не нужна.
+    """
+
+    async def _bootstrap(self, *args, **kwargs) -> None:
+        pass
+
+
+def create_updater(bot, update_queue, webhook: dict = None) -> Updater:
+    """Updater для параметров webhook_options(): без webhook_url - локальный"""
+    if webhook and not webhook.get("webhook_url"):
+        return LocalWebhookUpdater(bot, update_queue)
+    return Updater(bot, update_queue)
@@ -0,0 +1,96 @@
+import asyncio
+import functools
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Блокирующий файловый и SQLite-ввод/вывод выполняется здесь, а не в цикле событий
+WORKERS = 4
+_executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="storage")
+# Блокировка живёт, пока её кто-то держит или ждёт, поэтому словарь не растёт
+_locks = weakref.WeakValueDictionary()
+# Сборщик метрик (services.metrics); пока он не установлен, замеры не выполняются
+observer = None
+
+
+async def run_io(func, *args, **kwargs):
+    """Выполняет блокирующую функцию хранилища в пуле потоков"""
+    loop = asyncio.get_running_loop()
+    call = functools.partial(func, *args, **kwargs)
+    if observer is None:
+        return await loop.run_in_executor(_executor, call)
+
+    started = time.perf_counter()
+    try:
+        return await loop.run_in_executor(_executor, call)
+    finally:
+        observer.storage_call(getattr(func, '__name__', 'unknown'), time.perf_counter() - started)
+
+
+async def run_in_every_worker(func) -> None:
+    """Выполняет func в каждом потоке пула, например чтобы заранее открыть в них соединения"""
+    loop = asyncio.get_running_loop()
+    # Барьер держит поток занятым, пока остальные задачи не разойдутся по другим потокам
+    barrier = threading.Barrier(WORKERS)
+
+    def call():
+        func()
+        try:
+            barrier.wait(timeout=5)
+        except threading.BrokenBarrierError:
+            pass
+
+    await asyncio.gather(*(loop.run_in_executor(_executor, call) for _ in range(WORKERS)))
+
+
+def lock(*key) -> asyncio.Lock:
+    """asyncio-блокировка для ключа: файла ("file", path) или пользователя ("cart", user_id)"""
+    entry = _locks.get(key)
+    if entry is None:
+        entry = asyncio.Lock()
+        _locks[key] = entry
+    return entry
+
+
+def read_json(path: str, default=None):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            content = f.read()
+    except FileNotFoundError:
+        return default
+    if observer is not None:
+        observer.file_io("read", len(content.encode('utf-8')))
+    content = content.strip()
+    return json.loads(content) if content else default
+
+
+def write_json_atomic(path: str, data, indent: int = 2) -> None:
+    """Пишет JSON во временный файл рядом и подменяет им исходный через os.replace
+
+    Читатель видит либо старую, либо новую версию файла, но никогда не обрезанную.
+    """
+    directory = os.path.dirname(path) or '.'
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path), suffix='.tmp')
+    try:
+        if os.path.exists(path):
+            os.chmod(tmp_path, os.stat(path).st_mode & 0o777)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=indent)
+            f.flush()
+            os.fsync(f.fileno())
+            if observer is not None:
+                observer.file_io("write", os.fstat(f.fileno()).st_size)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
@@ -0,0 +1,213 @@
+import json
+import logging
+import threading
+import time
+from storage import db
+from storage.access import read_json, write_json_atomic
+
+logger = logging.getLogger(__name__)
+CART_FILE = 'data/carts.json'
+# Весь файл перечитывается и перезаписывается, а блокировка корзины в обработчиках
+# только по пользователю: без общей блокировки одновременные сохранения теряют друг друга
+_file_lock = threading.Lock()
+
+db.register_schema("""
+    CREATE TABLE IF NOT EXISTS carts (
+        user_id INTEGER PRIMARY KEY,
+        items TEXT NOT NULL,
+        updated_at REAL NOT NULL
+    )
+""")
+# Для уборки давно не менявшихся корзин (services.sweeper)
+db.register_schema("CREATE INDEX IF NOT EXISTS carts_updated ON carts (updated_at)")
+
+
+def compact(cart) -> dict:
+    """Корзина в виде {id товара: количество}; понимает и прежний список копий товаров"""
+    if isinstance(cart, dict):
+        return cart
+    result = {}
+    for item in cart or ():
+        result[item["id"]] = result.get(item["id"], 0) + item.get("quantity", 1)
+    return result
+
+
+class JsonCartStorage:
+    """Прежнее хранилище: весь data/carts.json перечитывается и перезаписывается"""
+
+    def _load_all(self) -> dict:
+        return read_json(CART_FILE, {})
+
+    def get(self, user_id: int) -> dict:
+        return compact(self._load_all().get(str(user_id)))
+
+    def save(self, user_id: int, cart: dict) -> None:
+        with _file_lock:
+            carts = {}
+            try:
+                carts = self._load_all()
+            except Exception as e:
+                logger.error(f"Ошибка чтения при сохранении корзины: {e}")
+
+            if cart:
+                carts[str(user_id)] = cart
+            else:
+                carts.pop(str(user_id), None)
+            write_json_atomic(CART_FILE, carts)
+
+    def clear(self, user_id: int) -> None:
+        self.save(user_id, {})
+
+    def evict(self, before: float, limit: int) -> int:
+        """Удаляет пустые корзины одной перезаписью файла. Времени изменения в файле нет,
+        поэтому устаревшие корзины этим хранилищем не удаляются"""
+        with _file_lock:
+            carts = self._load_all()
+            kept = {user_id: cart for user_id, cart in carts.items() if cart}
+            if len(kept) < len(carts):
+                write_json_atomic(CART_FILE, kept)
+        return len(carts) - len(kept)
+
+    def prepare(self) -> None:
+        pass
+
+
+class SqliteCartStorage:
+    """Корзины в SQLite (WAL): чтение и запись затрагивают только строку пользователя"""
+
+    def __init__(self):
+        self._migrated = False
+
+    def _conn(self):
+        conn = db.get_connection()
+        if not self._migrated:
+            migrate_from_json()
+            migrate_to_item_refs()
+            self._migrated = True
+        return conn
+
+    def get(self, user_id: int) -> dict:
+        row = self._conn().execute(
+            "SELECT items FROM carts WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        return compact(json.loads(row["items"])) if row else {}
+
+    def save(self, user_id: int, cart: dict) -> None:
+        conn = self._conn()
+        with conn:
+            if not cart:
+                # Пустая корзина хранится как отсутствие строки
+                conn.execute("DELETE FROM carts WHERE user_id = ?", (user_id,))
+                return
+            conn.execute(
+                "INSERT INTO carts (user_id, items, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET items = excluded.items, updated_at = excluded.updated_at",
+                (user_id, json.dumps(cart, ensure_ascii=False, separators=(',', ':')), time.time())
+            )
+
+    def clear(self, user_id: int) -> None:
+        self.save(user_id, {})
+
+    def evict(self, before: float, limit: int) -> int:
+        """Удаляет до limit корзин, не менявшихся с момента before, и пустые корзины"""
+        conn = self._conn()
+        with conn:
+            # Условие проверяется в момент удаления: только что изменённая корзина не пропадёт
+            cursor = conn.execute(
+                "DELETE FROM carts WHERE user_id IN (SELECT user_id FROM carts "
+                "WHERE updated_at < ? OR items IN ('{}', '[]') LIMIT ?)",
+                (before, limit)
+            )
+        return cursor.rowcount
+
+    def prepare(self) -> None:
+        """Открывает соединение и выполняет миграции заранее, до первого обращения"""
+        self._conn()
+
+
+BACKENDS = {
+    "json": JsonCartStorage,
+    "sqlite": SqliteCartStorage,
+}
+_storage = None
+
+
+def get_storage():
+    global _storage
+    if _storage is None:
+        from config import CART_STORAGE
+        _storage = BACKENDS[CART_STORAGE]()
+    return _storage
+
+
+def migrate_from_json() -> int:
+    """Однократно переносит data/carts.json в SQLite. Возвращает число перенесённых корзин"""
+    if db.get_meta("carts_migrated"):
+        return 0
+
+    try:
+        carts = JsonCartStorage()._load_all()
+    except json.JSONDecodeError as e:
+        logger.error(f"Ошибка декодирования корзины при миграции: {e}")
+        carts = {}
+
+    conn = db.get_connection()
+    now = time.time()
+    rows = [
+        (int(user_id), json.dumps(compact(cart), ensure_ascii=False, separators=(',', ':')), now)
+        for user_id, cart in carts.items() if cart
+    ]
+    with conn:
+        conn.executemany(
+            "INSERT OR IGNORE INTO carts (user_id, items, updated_at) VALUES (?, ?, ?)", rows
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('carts_migrated', ?)", (str(int(now)),)
+        )
+    logger.info(f"Корзины перенесены из {CART_FILE} в SQLite: {len(rows)}")
+    return len(rows)
+
+
+def migrate_to_item_refs() -> int:
+    """Однократно заменяет в SQLite и data/carts.json копии товаров на {id товара: количество}.
+
+    Возвращает число переписанных корзин.
+    """
+    if db.get_meta("carts_item_refs"):
+        return 0
+
+    converted = 0
+    conn = db.get_connection()
+    with conn:
+        rows = conn.execute("SELECT user_id, items FROM carts").fetchall()
+        updates = []
+        for row in rows:
+            cart = json.loads(row["items"])
+            if isinstance(cart, list):
+                updates.append((json.dumps(compact(cart), ensure_ascii=False, separators=(',', ':')), row["user_id"]))
+        conn.executemany("UPDATE carts SET items = ? WHERE user_id = ?", updates)
+        converted += len(updates)
+
+        # Файл нужен JSON-хранилищу и как источник для migrate_from_json
+        with _file_lock:
+            try:
+                carts = JsonCartStorage()._load_all()
+            except json.JSONDecodeError as e:
+                logger.error(f"Ошибка декодирования корзины при миграции: {e}")
+                carts = {}
+            if any(isinstance(cart, list) for cart in carts.values()):
+                compacted = {user_id: compact(cart) for user_id, cart in carts.items() if cart}
+                converted += sum(isinstance(cart, list) for cart in carts.values())
+                write_json_atomic(CART_FILE, compacted)
+
+        conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('carts_item_refs', ?)", (str(int(time.time())),)
+        )
+    logger.info(f"Корзины переведены на ссылки на товары: {converted}")
+    return converted
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    migrate_from_json()
+    migrate_to_item_refs()
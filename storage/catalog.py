@@ -0,0 +1,281 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from storage import db
+from storage.access import read_json, run_io, write_json_atomic
+
+logger = logging.getLogger(__name__)
+PRODUCTS_FILE = 'data/products.json'
+# Как часто обработчики проверяют, не изменили ли каталог другие процессы
+CHECK_INTERVAL = 1.0
+
+
+class _Snapshot:
+    """Разобранный каталог с индексами по id. После создания не изменяется."""
+
+    def __init__(self, products: dict, signature, version: int):
+        self.products = products
+        self.signature = signature
+        self.version = version
+        self.categories = {}
+        self.items = {}
+        self.item_category = {}
+        # Позиция товара внутри категории и сквозной список (категория, товар) для постраничного вывода
+        self.item_position = {}
+        self.all_items = []
+        for category in products.get("categories", []):
+            self.categories[category["id"]] = category
+            for position, item in enumerate(category.get("items", [])):
+                self.items[item["id"]] = item
+                self.item_category[item["id"]] = category
+                self.item_position[item["id"]] = position
+                self.all_items.append((category, item))
+
+
+# Сигнатура, которая не совпадает ни с одним состоянием файла
+_STALE = object()
+_snapshot = _Snapshot({"categories": []}, _STALE, 0)
+_lock = threading.RLock()
+# Фоновая проверка файла для цикла событий и время следующей
+_refresh_task = None
+_next_check = 0.0
+
+
+def _file_signature():
+    # Файл заменяется атомарно, поэтому после записи любого процесса меняется inode,
+    # даже если время изменения совпало с точностью часов файловой системы
+    try:
+        st = os.stat(PRODUCTS_FILE)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def _read_file() -> dict:
+    try:
+        products = read_json(PRODUCTS_FILE)
+    except json.JSONDecodeError as e:
+        logger.error(f"Ошибка загрузки товаров: {e}")
+        return {"categories": []}
+    if products is None:
+        logger.error(f"Ошибка загрузки товаров: файл {PRODUCTS_FILE} не найден или пуст")
+        return {"categories": []}
+    return products
+
+
+def _current() -> _Snapshot:
+    """Возвращает снимок каталога.
+
+    В цикле событий файл не проверяется и не разбирается: обработчики получают
+    загруженный снимок, а проверка раз в CHECK_INTERVAL уходит в пул потоков
+    хранилища, и новый снимок подменяет старый, когда готов. В остальных потоках
+    (в том числе при изменении каталога) снимок сверяется с файлом сразу.
+    """
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return _refresh()
+    if _snapshot.signature is _STALE:
+        # Каталог ещё не загружался (обычно его загружает warm_up): отдать пока нечего
+        return _refresh()
+    _schedule_refresh(loop)
+    return _snapshot
+
+
+def _schedule_refresh(loop) -> None:
+    global _refresh_task, _next_check
+    now = time.monotonic()
+    if now < _next_check:
+        return
+    if _refresh_task is not None and not _refresh_task.done() and _refresh_task.get_loop() is loop:
+        return
+    _next_check = now + CHECK_INTERVAL
+    _refresh_task = loop.create_task(run_io(_refresh))
+    _refresh_task.add_done_callback(_refresh_done)
+
+
+def _refresh_done(task) -> None:
+    if not task.cancelled() and task.exception():
+        logger.error(f"Ошибка обновления каталога: {task.exception()}")
+
+
+def _refresh() -> _Snapshot:
+    """Сверяет снимок с файлом и перечитывает файл, если он изменился"""
+    global _snapshot
+    snapshot = _snapshot
+    signature = _file_signature()
+    if signature == snapshot.signature:
+        return snapshot
+
+    with _lock:
+        snapshot = _snapshot
+        if signature == snapshot.signature:
+            return snapshot
+        products = _read_file()
+        _snapshot = _Snapshot(products, signature, snapshot.version + 1)
+        logger.info(f"Каталог загружен, версия {_snapshot.version}")
+        return _snapshot
+
+
+def _publish(products: dict) -> None:
+    """Атомарно записывает каталог на диск и сразу подменяет снимок в памяти.
+
+    Вызывается под db.immediate(): изменения из разных процессов не затирают друг друга,
+    а остальные процессы увидят новый файл по его сигнатуре при следующем обращении.
+    """
+    global _snapshot
+    write_json_atomic(PRODUCTS_FILE, products)
+    _snapshot = _Snapshot(products, _file_signature(), _snapshot.version + 1)
+
+
+def _editable_copy() -> dict:
+    # Снимок разделяется между обработчиками, поэтому изменяем только копию
+    return json.loads(json.dumps(_current().products))
+
+
+def get_products() -> dict:
+    return _current().products
+
+
+def get_version() -> int:
+    return _current().version
+
+
+def get_category(category_id: str):
+    return _current().categories.get(category_id)
+
+
+def get_item(item_id: str):
+    return _current().items.get(item_id)
+
+
+def get_items() -> dict:
+    """Все товары по id (не изменять)"""
+    return _current().items
+
+
+def get_item_category(item_id: str):
+    return _current().item_category.get(item_id)
+
+
+def get_item_position(item_id: str):
+    """Индекс товара в списке его категории"""
+    return _current().item_position.get(item_id)
+
+
+def get_items_page(offset: int, limit: int) -> tuple:
+    """Срез сквозного списка (категория, товар) и общее число товаров"""
+    snapshot = _current()
+    return snapshot.all_items[offset:offset + limit], len(snapshot.all_items)
+
+
+def add_category(name: str) -> str:
+    category_id = f"cat_{uuid.uuid4().hex[:8]}"
+    with _lock, db.immediate():
+        products = _editable_copy()
+        products["categories"].append({
+            "id": category_id,
+            "name": name,
+            "items": []
+        })
+        _publish(products)
+    return category_id
+
+
+def add_item(category_id: str, name: str, price: int, file_id: str) -> str:
+    item_id = f"item_{uuid.uuid4().hex[:8]}"
+    with _lock, db.immediate():
+        products = _editable_copy()
+        for category in products["categories"]:
+            if category["id"] == category_id:
+                category["items"].append({
+                    "id": item_id,
+                    "name": name,
+                    "price": price,
+                    "file_id": file_id
+                })
+                break
+        _publish(products)
+    return item_id
+
+
+def remove_item(item_id: str) -> None:
+    with _lock, db.immediate():
+        products = _editable_copy()
+        for category in products["categories"]:
+            category["items"] = [item for item in category["items"] if item["id"] != item_id]
+        _publish(products)
+
+
+def name_key(name: str) -> str:
+    """Название для сопоставления категорий и товаров: без пробелов по краям и регистра"""
+    return name.strip().casefold()
+
+
+def import_items(rows: list, replace: bool = False) -> dict:
+    """Применяет проверенные строки манифеста одной записью каталога.
+
+    Строка - {"id", "category", "name", "price", "file_id"}. Товар ищется по id, а без id -
+    по названию в категории; найденный обновляется (пустой file_id не меняет файл),
+    остальные добавляются. Категории сопоставляются по названию и создаются при
+    необходимости. При replace товары, которых нет в манифесте, удаляются вместе с
+    категориями, которые из-за этого опустели; пустые до импорта категории остаются.
+    Возвращает число добавленных, обновлённых и удалённых товаров и названия
+    удалённых категорий.
+    """
+    result = {"added": 0, "updated": 0, "removed": 0, "removed_categories": []}
+    with _lock, db.immediate():
+        products = _editable_copy()
+        filled = {category["id"] for category in products["categories"] if category["items"]}
+        categories = {name_key(category["name"]): category for category in products["categories"]}
+        # id товара -> (категория, товар) и (категория, название) -> id
+        located = {}
+        by_name = {}
+        for category in products["categories"]:
+            for item in category["items"]:
+                located[item["id"]] = (category, item)
+                by_name[(name_key(category["name"]), name_key(item["name"]))] = item["id"]
+
+        touched = set()
+        for row in rows:
+            category_key = name_key(row["category"])
+            category = categories.get(category_key)
+            if category is None:
+                category = {"id": f"cat_{uuid.uuid4().hex[:8]}", "name": row["category"].strip(), "items": []}
+                products["categories"].append(category)
+                categories[category_key] = category
+
+            item_id = row.get("id") or by_name.get((category_key, name_key(row["name"])))
+            if item_id in located:
+                current_category, item = located[item_id]
+                item["name"] = row["name"]
+                item["price"] = row["price"]
+                if row.get("file_id"):
+                    item["file_id"] = row["file_id"]
+                if current_category is not category:
+                    current_category["items"].remove(item)
+                    category["items"].append(item)
+                result["updated"] += 1
+            else:
+                item_id = item_id or f"item_{uuid.uuid4().hex[:8]}"
+                item = {"id": item_id, "name": row["name"], "price": row["price"], "file_id": row.get("file_id", "")}
+                category["items"].append(item)
+                result["added"] += 1
+            located[item_id] = (category, item)
+            by_name[(category_key, name_key(item["name"]))] = item_id
+            touched.add(item_id)
+
+        if replace:
+            for category in products["categories"]:
+                kept = [item for item in category["items"] if item["id"] in touched]
+                result["removed"] += len(category["items"]) - len(kept)
+                category["items"] = kept
+            emptied = [category for category in products["categories"] if category["id"] in filled and not category["items"]]
+            result["removed_categories"] = [category["name"] for category in emptied]
+            products["categories"] = [category for category in products["categories"] if category not in emptied]
+        _publish(products)
+    return result
@@ -0,0 +1,126 @@
+import contextlib
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+DB_FILE = 'data/bot.db'
+
+# Схема общая для всех хранилищ; модули добавляют свои таблицы через register_schema
+_schema = [
+    """
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    )
+    """
+]
+_local = threading.local()
+
+
+def register_schema(sql: str) -> None:
+    """Регистрирует DDL, который будет выполнен на каждом новом соединении"""
+    _schema.append(sql)
+
+
+def register_column(table: str, column: str, declaration: str) -> None:
+    """Добавляет столбец в уже существующую таблицу, если его ещё нет"""
+    def migrate(conn):
+        columns = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+        if column not in columns:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+    _schema.append(migrate)
+
+
+def get_connection() -> sqlite3.Connection:
+    """Соединение для текущего потока (sqlite3 не разделяет их между потоками)"""
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(DB_FILE, timeout=30)
+        conn.row_factory = sqlite3.Row
+        # Действует только для новой базы: освобождённые страницы можно вернуть порциями (compact)
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        # WAL позволяет читать параллельно с записью, NORMAL достаточно для WAL
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        _local.conn = conn
+        _local.applied = 0
+
+    if _local.applied < len(_schema):
+        with conn:
+            for sql in _schema[_local.applied:]:
+                if callable(sql):
+                    sql(conn)
+                else:
+                    conn.execute(sql)
+        _local.applied = len(_schema)
+    return conn
+
+
+@contextlib.contextmanager
+def transaction():
+    """Транзакция на соединении потока; вложенные вызовы входят во внешнюю транзакцию"""
+    conn = get_connection()
+    depth = getattr(_local, 'depth', 0)
+    _local.depth = depth + 1
+    try:
+        if depth:
+            yield conn
+        else:
+            with conn:
+                yield conn
+    finally:
+        _local.depth = depth
+
+
+@contextlib.contextmanager
+def immediate():
+    """Транзакция, сразу берущая блокировку записи базы. Ею же сериализуются
+    изменения каталога (data/products.json) между процессами бота"""
+    with transaction() as conn:
+        if not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")
+        yield conn
+
+
+def compact(pages: int) -> None:
+    """Возвращает системе до pages свободных страниц и сокращает WAL-журнал.
+    Короткие операции: их можно выполнять регулярно, не останавливая бота
+    (кроме однократного VACUUM базы, созданной без auto_vacuum)"""
+    conn = get_connection()
+    _enable_auto_vacuum(conn)
+    conn.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+    conn.execute("PRAGMA optimize").fetchall()
+
+
+def _enable_auto_vacuum(conn: sqlite3.Connection) -> None:
+    """Однократно переводит базу, созданную без auto_vacuum, в режим INCREMENTAL.
+
+    Режим меняется только полным VACUUM: он переписывает файл и на это время
+    блокирует запись, поэтому выполняется один раз и отмечается в meta
+    """
+    if get_meta("auto_vacuum_incremental"):
+        return
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 0:
+        started = time.perf_counter()
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("VACUUM")
+        logger.info(f"База переведена в режим auto_vacuum=INCREMENTAL за {time.perf_counter() - started:.2f} с")
+    set_meta("auto_vacuum_incremental", "1")
+
+
+def get_meta(key: str, default=None):
+    row = get_connection().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return row["value"] if row else default
+
+
+def set_meta(key: str, value: str) -> None:
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            "INSERT INTO meta (key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, value)
+        )
@@ -0,0 +1,257 @@
+import json
+import logging
+import os
+import threading
+import time
+from storage import catalog as catalog_store
+from storage import db
+from storage import outbox
+from storage import stats
+
+logger = logging.getLogger(__name__)
+ORDERS_FILE = 'data/orders.json'
+
+db.register_schema("""
+    CREATE TABLE IF NOT EXISTS orders (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        username TEXT,
+        date TEXT NOT NULL,
+        items TEXT NOT NULL,
+        total INTEGER NOT NULL,
+        status TEXT NOT NULL,
+        receipt_file_id TEXT
+    )
+""")
+db.register_schema("CREATE INDEX IF NOT EXISTS orders_status ON orders (status, id)")
+db.register_schema("CREATE INDEX IF NOT EXISTS orders_user ON orders (user_id, id)")
+# Постоянный идентификатор файла чека: одинаков у повторных загрузок одного файла
+db.register_column("orders", "receipt_unique_id", "TEXT")
+
+# Когда админу напомнили о долго ждущем подтверждения заказе (services.sweeper)
+db.register_column("orders", "reminded_at", "REAL")
+
+_COLUMNS = ("user_id", "username", "date", "items", "total", "status", "receipt_file_id", "receipt_unique_id")
+_INSERT = f"INSERT INTO orders ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})"
+_migrated = False
+_migrate_lock = threading.Lock()
+
+
+def _conn():
+    global _migrated
+    conn = db.get_connection()
+    if not _migrated:
+        with _migrate_lock:
+            if not _migrated:
+                migrate_from_json()
+                backfilled = migrate_item_categories()
+                if backfilled or not db.get_meta("sales_stats_built"):
+                    # Итоги продаж появились позже журнала: строим их по уже накопленным заказам
+                    stats.rebuild()
+                _migrated = True
+    return conn
+
+
+def category_fields(category) -> dict:
+    """Категория товара, сохраняемая в позиции заказа: итоги продаж (storage.stats)
+    не должны зависеть от того, что позже сделают с товаром в каталоге"""
+    if category is None:
+        return {"category_id": "", "category_name": ""}
+    return {"category_id": category["id"], "category_name": category["name"]}
+
+
+def prepare() -> None:
+    """Открывает соединение и переносит заказы из JSON заранее, до первого обращения"""
+    _conn()
+
+
+def _to_order(row) -> dict:
+    order = dict(row)
+    order["items"] = json.loads(order["items"])
+    return order
+
+
+def create_order(order_data: dict, notify=None) -> int:
+    """Добавляет заказ в журнал и возвращает его номер.
+
+    notify(номер заказа) возвращает сообщения (chat_id, method, payload) для outbox;
+    они ставятся в той же транзакции, поэтому заказ без уведомления админу не сохранится
+    """
+    values = dict(order_data, items=json.dumps(order_data["items"], ensure_ascii=False))
+    _conn()
+    with db.transaction() as conn:
+        cursor = conn.execute(_INSERT, tuple(values.get(column) for column in _COLUMNS))
+        stats.apply(conn, order_data, order_data["status"])
+        if notify:
+            outbox.enqueue(notify(cursor.lastrowid))
+    return cursor.lastrowid
+
+
+def get_order(order_id: int):
+    row = _conn().execute("SELECT * FROM orders WHERE id = ?", (order_id,)).fetchone()
+    return _to_order(row) if row else None
+
+
+def page_orders(status: str = None, before_id: int = None, after_id: int = None, limit: int = 5) -> tuple:
+    """Страница заказов (новые сверху) по курсору id; читаются только записи страницы.
+
+    before_id - следующая страница (более старые заказы), after_id - предыдущая.
+    Возвращает (заказы, есть_старее, есть_новее).
+    """
+    where = []
+    params = []
+    if status:
+        where.append("status = ?")
+        params.append(status)
+    if after_id:
+        where.append("id > ?")
+        params.append(after_id)
+    elif before_id:
+        where.append("id < ?")
+        params.append(before_id)
+    # К предыдущей странице идём по возрастанию id от курсора, затем разворачиваем
+    order = "ASC" if after_id else "DESC"
+    sql = "SELECT * FROM orders"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY id {order} LIMIT ?"
+
+    conn = _conn()
+    orders = [_to_order(row) for row in conn.execute(sql, (*params, limit))]
+    if after_id:
+        orders.reverse()
+    if not orders:
+        return [], False, False
+
+    status_filter = "status = ? AND " if status else ""
+    status_params = (status,) if status else ()
+    has_older = conn.execute(
+        f"SELECT EXISTS (SELECT 1 FROM orders WHERE {status_filter}id < ?)",
+        (*status_params, orders[-1]["id"])
+    ).fetchone()[0]
+    has_newer = conn.execute(
+        f"SELECT EXISTS (SELECT 1 FROM orders WHERE {status_filter}id > ?)",
+        (*status_params, orders[0]["id"])
+    ).fetchone()[0]
+    return orders, bool(has_older), bool(has_newer)
+
+
+def recent_receipt_ids(limit: int) -> list:
+    """file_unique_id чеков последних заказов, от старых к новым"""
+    rows = _conn().execute(
+        "SELECT receipt_unique_id FROM orders WHERE receipt_unique_id IS NOT NULL ORDER BY id DESC LIMIT ?",
+        (limit,)
+    ).fetchall()
+    return [row[0] for row in reversed(rows)]
+
+
+def approve(order_id: int, messages: list) -> bool:
+    """Переводит ожидающий заказ в "paid" и ставит его доставку в outbox одной транзакцией"""
+    _conn()
+    with db.transaction() as conn:
+        cursor = conn.execute(
+            "UPDATE orders SET status = 'paid' WHERE id = ? AND status = 'pending'", (order_id,)
+        )
+        if cursor.rowcount == 0:
+            return False
+        stats.change_status(conn, get_order(order_id), "pending", "paid")
+        outbox.enqueue(messages, order_id=order_id)
+    return True
+
+
+def stale_pending(before: str, limit: int) -> list:
+    """Ожидающие заказы, оформленные раньше before ("ГГГГ-ММ-ДД ЧЧ:ММ"), о которых ещё не напоминали"""
+    rows = _conn().execute(
+        "SELECT * FROM orders WHERE status = 'pending' AND reminded_at IS NULL AND date < ? "
+        "ORDER BY id LIMIT ?",
+        (before, limit)
+    ).fetchall()
+    return [_to_order(row) for row in rows]
+
+
+def mark_reminded(order_ids: list, messages: list) -> None:
+    """Отмечает заказы и ставит напоминание в outbox одной транзакцией: напоминание
+    не потеряется и не повторится"""
+    _conn()
+    with db.transaction() as conn:
+        conn.executemany(
+            "UPDATE orders SET reminded_at = ? WHERE id = ?", [(time.time(), order_id) for order_id in order_ids]
+        )
+        outbox.enqueue(messages)
+
+
+def mark_delivered_if_complete(order_id: int) -> bool:
+    """Отмечает оплаченный заказ доставленным, когда все его сообщения отправлены.
+
+    Отправленные сообщения удаляются из outbox, а неотправленные остаются со статусом
+    "failed", поэтому заказ с ошибкой доставки остаётся оплаченным.
+    """
+    with db.transaction() as conn:
+        cursor = conn.execute(
+            "UPDATE orders SET status = 'delivered' WHERE id = ? AND status = 'paid' "
+            "AND NOT EXISTS (SELECT 1 FROM outbox WHERE order_id = ?)",
+            (order_id, order_id)
+        )
+    return cursor.rowcount > 0
+
+
+def migrate_item_categories() -> int:
+    """Однократно дописывает категорию в позиции заказов, сохранённых без неё,
+    по каталогу на момент миграции. Возвращает число изменённых заказов"""
+    if db.get_meta("orders_item_categories"):
+        return 0
+
+    with db.transaction() as conn:
+        updates = []
+        for row in conn.execute("SELECT id, items FROM orders"):
+            items = json.loads(row["items"])
+            if all("category_id" in item for item in items):
+                continue
+            items = [
+                item if "category_id" in item
+                else dict(item, **category_fields(catalog_store.get_item_category(item["id"])))
+                for item in items
+            ]
+            updates.append((json.dumps(items, ensure_ascii=False), row["id"]))
+        conn.executemany("UPDATE orders SET items = ? WHERE id = ?", updates)
+        conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('orders_item_categories', ?)", (str(int(time.time())),)
+        )
+    if updates:
+        logger.info(f"В заказы добавлены категории товаров: {len(updates)}")
+    return len(updates)
+
+
+def migrate_from_json() -> int:
+    """Однократно переносит data/orders.json (заказы по user_id) в журнал заказов"""
+    if db.get_meta("orders_migrated"):
+        return 0
+
+    orders = {}
+    try:
+        if os.path.exists(ORDERS_FILE):
+            with open(ORDERS_FILE, 'r', encoding='utf-8') as f:
+                content = f.read()
+                if content.strip():
+                    orders = json.loads(content)
+    except json.JSONDecodeError as e:
+        logger.error(f"Ошибка декодирования заказов при миграции: {e}")
+
+    conn = db.get_connection()
+    rows = []
+    for order in sorted(orders.values(), key=lambda o: o.get("date", "")):
+        order = dict(order, items=json.dumps(order.get("items", []), ensure_ascii=False))
+        order.setdefault("status", "pending")
+        order.setdefault("total", 0)
+        order.setdefault("date", "")
+        rows.append(tuple(order.get(column) for column in _COLUMNS))
+    with conn:
+        conn.executemany(_INSERT, rows)
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('orders_migrated', '1')")
+    logger.info(f"Заказы перенесены из {ORDERS_FILE} в SQLite: {len(rows)}")
+    return len(rows)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    migrate_from_json()
@@ -0,0 +1,93 @@
+import json
+import time
+from storage import db
+
+# Исходящие сообщения, которые должны быть доставлены даже после перезапуска бота
+db.register_schema("""
+    CREATE TABLE IF NOT EXISTS outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        chat_id INTEGER NOT NULL,
+        method TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt_at REAL NOT NULL,
+        last_error TEXT,
+        created_at REAL NOT NULL
+    )
+""")
+db.register_schema("CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt_at)")
+db.register_schema("CREATE INDEX IF NOT EXISTS outbox_chat ON outbox (chat_id, status, id)")
+# Сообщения доставки заказа привязаны к нему, чтобы отметить заказ выполненным
+db.register_column("outbox", "order_id", "INTEGER")
+db.register_schema("CREATE INDEX IF NOT EXISTS outbox_order ON outbox (order_id, status)")
+
+
+def enqueue(messages: list, order_id: int = None) -> None:
+    """Ставит в очередь список (chat_id, method, payload) одной транзакцией, сохраняя порядок"""
+    now = time.time()
+    with db.transaction() as conn:
+        conn.executemany(
+            "INSERT INTO outbox (chat_id, method, payload, next_attempt_at, created_at, order_id) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [(chat_id, method, json.dumps(payload, ensure_ascii=False), now, now, order_id)
+             for chat_id, method, payload in messages]
+        )
+
+
+def _shard_filter(shard) -> tuple:
+    """Условие на чаты шарда (номер, всего): каждый рабочий процесс отправляет только в свои чаты"""
+    if shard is None:
+        return "", ()
+    index, count = shard
+    return " AND abs(chat_id) % ? = ?", (count, index)
+
+
+def fetch_due(limit: int = 20, shard: tuple = None) -> list:
+    """Первые неотправленные сообщения каждого чата, время которых подошло.
+
+    Пока более раннее сообщение чата ждёт повтора, следующие за ним не выдаются,
+    так что порядок сообщений в чате сохраняется.
+    """
+    condition, params = _shard_filter(shard)
+    rows = db.get_connection().execute(
+        "SELECT * FROM outbox AS o WHERE status = 'pending' AND next_attempt_at <= ?" + condition +
+        " AND NOT EXISTS (SELECT 1 FROM outbox AS e WHERE e.chat_id = o.chat_id "
+        "AND e.status = 'pending' AND e.id < o.id) "
+        "ORDER BY id LIMIT ?",
+        (time.time(), *params, limit)
+    )
+    return [dict(row, payload=json.loads(row["payload"])) for row in rows]
+
+
+def next_attempt_at(shard: tuple = None):
+    condition, params = _shard_filter(shard)
+    row = db.get_connection().execute(
+        "SELECT MIN(next_attempt_at) FROM outbox WHERE status = 'pending'" + condition, params
+    ).fetchone()
+    return row[0]
+
+
+def mark_sent(message_id: int) -> None:
+    conn = db.get_connection()
+    with conn:
+        conn.execute("DELETE FROM outbox WHERE id = ?", (message_id,))
+
+
+def reschedule(message_id: int, delay: float, error: str) -> None:
+    conn = db.get_connection()
+    with conn:
+        conn.execute(
+            "UPDATE outbox SET attempts = attempts + 1, next_attempt_at = ?, last_error = ? WHERE id = ?",
+            (time.time() + delay, error, message_id)
+        )
+
+
+def mark_failed(message_id: int, error: str) -> None:
+    """Сообщение больше не отправляется, но остаётся в таблице для разбора"""
+    conn = db.get_connection()
+    with conn:
+        conn.execute(
+            "UPDATE outbox SET status = 'failed', attempts = attempts + 1, last_error = ? WHERE id = ?",
+            (error, message_id)
+        )
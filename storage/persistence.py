@@ -0,0 +1,153 @@
+import asyncio
+import json
+import logging
+from telegram.ext import BasePersistence, PersistenceInput
+from storage import db
+from storage.access import run_io
+
+logger = logging.getLogger(__name__)
+
+db.register_schema("""
+    CREATE TABLE IF NOT EXISTS persistence (
+        kind TEXT NOT NULL,
+        key TEXT NOT NULL,
+        value TEXT NOT NULL,
+        PRIMARY KEY (kind, key)
+    ) WITHOUT ROWID
+""")
+
+# Пауза после первого изменения, за которую накопившиеся изменения уходят одной транзакцией
+FLUSH_DELAY = 1.0
+
+
+class SqlitePersistence(BasePersistence):
+    """user_data, chat_data, bot_data и состояния диалогов в таблице persistence (data/bot.db).
+
+    PTB передаёт изменения раз в update_interval секунд. Они сериализуются сразу,
+    копятся в памяти и записываются одной транзакцией через FLUSH_DELAY секунд,
+    так что обработка обновлений запись в базу не ждёт.
+
+    В многопроцессном режиме shard = (номер, всего): процесс загружает только данные
+    своих пользователей и чатов, поэтому процессы пишут в разные строки таблицы.
+    """
+
+    def __init__(self, update_interval: float = 60, flush_delay: float = FLUSH_DELAY, shard: tuple = None):
+        super().__init__(store_data=PersistenceInput(callback_data=False), update_interval=update_interval)
+        self.flush_delay = flush_delay
+        self.shard = shard
+        # (вид, ключ) -> JSON значения или None для удаления
+        self._pending = {}
+        self._flush_task = None
+        self._write_lock = asyncio.Lock()
+
+    # Чтение выполняется один раз при запуске приложения
+
+    async def get_user_data(self) -> dict:
+        data = {int(key): value for key, value in (await run_io(_load, "user")).items()}
+        return {key: value for key, value in data.items() if self._owns(key)}
+
+    async def get_chat_data(self) -> dict:
+        data = {int(key): value for key, value in (await run_io(_load, "chat")).items()}
+        return {key: value for key, value in data.items() if self._owns(key)}
+
+    async def get_bot_data(self) -> dict:
+        return (await run_io(_load, "bot")).get("", {})
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name: str) -> dict:
+        states = await run_io(_load, f"conversation:{name}")
+        # Ключ диалога (chat_id, user_id): пользователь - последний элемент
+        conversations = {tuple(json.loads(key)): state for key, state in states.items()}
+        return {key: state for key, state in conversations.items() if self._owns(key[-1])}
+
+    # Изменения. PTB сообщает о каждом пользователе и чате, приславшем обновление,
+    # поэтому пустые словари хранятся как отсутствие строки
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        self._stage("user", str(user_id), data or None)
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        self._stage("chat", str(chat_id), data or None)
+
+    async def update_bot_data(self, data: dict) -> None:
+        self._stage("bot", "", data or None)
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def update_conversation(self, name: str, key: tuple, new_state) -> None:
+        # Завершённый диалог (None) хранится как отсутствие строки
+        self._stage(f"conversation:{name}", json.dumps(list(key)), new_state)
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._stage("user", str(user_id), None)
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        self._stage("chat", str(chat_id), None)
+
+    # Данные в памяти приложения всегда свежее базы, перечитывать нечего
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        pass
+
+    async def flush(self) -> None:
+        """Записывает всё накопленное (вызывается PTB при остановке)"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self._write_pending()
+
+    def _owns(self, owner: int) -> bool:
+        return self.shard is None or abs(owner) % self.shard[1] == self.shard[0]
+
+    def _stage(self, kind: str, key: str, value) -> None:
+        # Сериализуем сразу: словарь продолжит меняться, а записать нужно снимок
+        self._pending[(kind, key)] = None if value is None else json.dumps(value, ensure_ascii=False)
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_later(), name="persistence-flush")
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.flush_delay)
+        # Дальше задачу уже не отменяют: запись должна завершиться
+        self._flush_task = None
+        await self._write_pending()
+
+    async def _write_pending(self) -> None:
+        async with self._write_lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, {}
+            try:
+                await run_io(_write, pending)
+            except Exception as e:
+                logger.error(f"Ошибка сохранения состояния бота: {e}")
+                # Повторим со следующей порцией; более новые значения важнее
+                self._pending = {**pending, **self._pending}
+
+
+def _load(kind: str) -> dict:
+    rows = db.get_connection().execute(
+        "SELECT key, value FROM persistence WHERE kind = ?", (kind,)
+    ).fetchall()
+    return {row["key"]: json.loads(row["value"]) for row in rows}
+
+
+def _write(pending: dict) -> None:
+    with db.transaction() as conn:
+        conn.executemany(
+            "DELETE FROM persistence WHERE kind = ? AND key = ?",
+            [key for key, value in pending.items() if value is None]
+        )
+        conn.executemany(
+            "INSERT INTO persistence (kind, key, value) VALUES (?, ?, ?) "
+            "ON CONFLICT(kind, key) DO UPDATE SET value = excluded.value",
+            [(kind, key, value) for (kind, key), value in pending.items() if value is not None]
+        )
@@ -0,0 +1,116 @@
+import bisect
+import heapq
+import re
+import threading
+from storage import catalog as catalog_store
+
+# Окончания русских слов, отбрасываемые при нормализации (от длинных к коротким)
+_ENDINGS = sorted([
+    "иями", "ями", "ами", "иях", "ях", "ах", "ией", "ей", "ий", "ый", "ой", "ая", "яя",
+    "ое", "ее", "ие", "ые", "ого", "его", "ому", "ему", "ым", "им", "ом", "ем", "ую",
+    "юю", "ия", "ья", "ье", "ьи", "ью", "ию", "ии", "ов", "ев",
+    "а", "я", "о", "е", "ы", "и", "у", "ю", "ь", "й"
+], key=len, reverse=True)
+_MIN_STEM = 3
+_WORD = re.compile(r"[0-9a-zа-я]+")
+
+
+def normalize(text: str) -> list:
+    """Слова текста в нижнем регистре, без "ё" и с отброшенными окончаниями"""
+    words = _WORD.findall(text.lower().replace("ё", "е"))
+    return [_stem(word) for word in words]
+
+
+def _stem(word: str) -> str:
+    for ending in _ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= _MIN_STEM:
+            return word[:-len(ending)]
+    return word
+
+
+class SearchIndex:
+    """Инвертированный индекс по названиям товаров с поиском по префиксу основы слова"""
+
+    def __init__(self):
+        self.version = None
+        self._postings = {}
+        self._terms = []
+        self._item_terms = {}
+        self._lock = threading.Lock()
+
+    def rebuild(self) -> None:
+        with self._lock:
+            self._postings = {}
+            self._item_terms = {}
+            products = catalog_store.get_products()
+            self.version = catalog_store.get_version()
+            for category in products["categories"]:
+                for item in category["items"]:
+                    self._index(item)
+            self._terms = sorted(self._postings)
+
+    def add(self, item_id: str) -> None:
+        """Добавляет в индекс товар, только что созданный в каталоге"""
+        item = catalog_store.get_item(item_id)
+        with self._lock:
+            if item:
+                for term in self._index(item):
+                    bisect.insort(self._terms, term)
+            self.version = catalog_store.get_version()
+
+    def remove(self, item_id: str) -> None:
+        with self._lock:
+            for term in self._item_terms.pop(item_id, ()):
+                posting = self._postings.get(term)
+                if posting is None:
+                    continue
+                posting.discard(item_id)
+                if not posting:
+                    del self._postings[term]
+                    index = bisect.bisect_left(self._terms, term)
+                    if index < len(self._terms) and self._terms[index] == term:
+                        del self._terms[index]
+            self.version = catalog_store.get_version()
+
+    def search(self, query: str, limit: int = 20) -> list:
+        """Товары, в названии которых каждое слово запроса совпадает с началом какого-то слова"""
+        if self.version != catalog_store.get_version():
+            # Каталог изменён в обход админки (например, правкой файла) - строим заново
+            self.rebuild()
+
+        terms = normalize(query)
+        if not terms:
+            return []
+
+        with self._lock:
+            found = None
+            for term in terms:
+                matches = set()
+                index = bisect.bisect_left(self._terms, term)
+                while index < len(self._terms) and self._terms[index].startswith(term):
+                    matches |= self._postings[self._terms[index]]
+                    index += 1
+                found = matches if found is None else found & matches
+                if not found:
+                    return []
+
+        # Один снимок каталога на весь запрос, а не os.stat на каждый товар
+        catalog_items = catalog_store.get_items()
+        items = [catalog_items[item_id] for item_id in found if item_id in catalog_items]
+        return heapq.nsmallest(limit, items, key=lambda item: item["name"])
+
+    def _index(self, item: dict) -> list:
+        """Добавляет товар в списки вхождений и возвращает термины, которых раньше не было"""
+        new_terms = []
+        terms = set(normalize(item["name"]))
+        self._item_terms[item["id"]] = terms
+        for term in terms:
+            posting = self._postings.get(term)
+            if posting is None:
+                posting = self._postings[term] = set()
+                new_terms.append(term)
+            posting.add(item["id"])
+        return new_terms
+
+
+index = SearchIndex()
@@ -0,0 +1,134 @@
+import datetime
+import json
+import logging
+import time
+from storage import db
+
+logger = logging.getLogger(__name__)
+
+# Текущие итоги продаж по дням: по товарам, категориям и в целом, отдельно для
+# ожидающих и оплаченных заказов. Обновляются в той же транзакции, что и заказ
+db.register_schema("""
+    CREATE TABLE IF NOT EXISTS sales_daily (
+        day TEXT NOT NULL,
+        dimension TEXT NOT NULL,
+        key TEXT NOT NULL,
+        state TEXT NOT NULL,
+        label TEXT NOT NULL,
+        orders INTEGER NOT NULL,
+        units INTEGER NOT NULL,
+        revenue INTEGER NOT NULL,
+        PRIMARY KEY (day, dimension, key, state)
+    ) WITHOUT ROWID
+""")
+
+# Статус заказа -> состояние в итогах; доставленный заказ остаётся оплаченным
+STATES = {"pending": "pending", "paid": "paid", "delivered": "paid"}
+UNCATEGORIZED = "Без категории"
+_LISTS = {"item": "items", "category": "categories"}
+
+_UPSERT = (
+    "INSERT INTO sales_daily (day, dimension, key, state, label, orders, units, revenue) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+    "ON CONFLICT(day, dimension, key, state) DO UPDATE SET "
+    "label = excluded.label, orders = orders + excluded.orders, "
+    "units = units + excluded.units, revenue = revenue + excluded.revenue"
+)
+
+
+def _buckets(order: dict) -> list:
+    """(день, измерение, ключ, подпись, заказов, штук, выручка) для одного заказа"""
+    day = (order.get("date") or "")[:10]
+    rows = []
+    categories = {}
+    units_total = revenue_total = 0
+    for item in order["items"]:
+        quantity = item.get("quantity", 1)
+        revenue = item["price"] * quantity
+        rows.append((day, "item", item["id"], item["name"], 1, quantity, revenue))
+
+        # Категория сохранена в заказе при оформлении (orders.category_fields)
+        key = item.get("category_id") or ""
+        entry = categories.setdefault(key, [item.get("category_name") or UNCATEGORIZED, 0, 0])
+        entry[1] += quantity
+        entry[2] += revenue
+        units_total += quantity
+        revenue_total += revenue
+
+    # Заказ с несколькими товарами одной категории считается в ней один раз
+    for key, (label, units, revenue) in categories.items():
+        rows.append((day, "category", key, label, 1, units, revenue))
+    rows.append((day, "total", "", "", 1, units_total, revenue_total))
+    return rows
+
+
+def apply(conn, order: dict, status: str, sign: int = 1) -> None:
+    """Добавляет (sign=1) или вычитает (sign=-1) заказ в итогах; вызывается внутри транзакции"""
+    state = STATES.get(status)
+    if state is None:
+        return
+    conn.executemany(_UPSERT, [
+        (day, dimension, key, state, label, sign * orders, sign * units, sign * revenue)
+        for day, dimension, key, label, orders, units, revenue in _buckets(order)
+    ])
+    if sign < 0:
+        conn.execute("DELETE FROM sales_daily WHERE day = ? AND orders = 0", ((order.get("date") or "")[:10],))
+
+
+def change_status(conn, order: dict, old_status: str, new_status: str) -> None:
+    if STATES.get(old_status) == STATES.get(new_status):
+        return
+    apply(conn, order, old_status, -1)
+    apply(conn, order, new_status, 1)
+
+
+def summary(days: int) -> dict:
+    """Итоги за последние days дней (включая сегодня); читаются только строки итогов.
+
+    {"since": день, "total": {состояние: (заказов, штук, выручка)},
+     "categories": [...], "items": [...]}, где списки содержат
+    (подпись, заказов, штук, выручка) оплаченных заказов по убыванию выручки.
+    """
+    since = (datetime.date.today() - datetime.timedelta(days=days - 1)).isoformat()
+    rows = db.get_connection().execute(
+        "SELECT dimension, key, state, MAX(label) AS label, SUM(orders) AS orders, "
+        "SUM(units) AS units, SUM(revenue) AS revenue FROM sales_daily "
+        "WHERE day >= ? GROUP BY dimension, key, state",
+        (since,)
+    ).fetchall()
+
+    result = {"since": since, "total": {}, "categories": [], "items": []}
+    for row in rows:
+        values = (row["orders"], row["units"], row["revenue"])
+        if row["dimension"] == "total":
+            result["total"][row["state"]] = values
+        elif row["state"] == "paid":
+            result[_LISTS[row["dimension"]]].append((row["label"], *values))
+    for key in ("categories", "items"):
+        result[key].sort(key=lambda entry: entry[3], reverse=True)
+    return result
+
+
+def rebuild() -> int:
+    """Пересчитывает итоги по всему журналу заказов. Возвращает число учтённых заказов"""
+    count = 0
+    with db.transaction() as conn:
+        conn.execute("DELETE FROM sales_daily")
+        # Заказы читаются курсором, без загрузки всего журнала в память
+        for row in conn.execute("SELECT date, items, status FROM orders"):
+            order = {"date": row["date"], "items": json.loads(row["items"])}
+            apply(conn, order, row["status"])
+            count += 1
+        conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('sales_stats_built', ?)", (str(int(time.time())),)
+        )
+    logger.info(f"Итоги продаж пересчитаны по {count} заказам")
+    return count
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    # Таблица заказов должна существовать до пересчёта
+    from storage import orders
+    orders.prepare()
+    rebuild()
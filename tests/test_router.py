@@ -0,0 +1,181 @@
+"""Каждая кнопка, которую показывает бот, должна попадать ровно в один обработчик.
+
+Приложение собирается через bot.register_handlers, запросы к Bot API уходят в
+заглушку нагрузочного прогона (benchmarks/load.py), которая здесь ещё и запоминает
+отправленные клавиатуры. Тест обходит
+экраны, нажимая каждую новую кнопку, пока новые кнопки не перестанут появляться.
+
+    python -m pytest -q tests
+"""
+import asyncio
+import json
+import os
+import sys
+from collections import deque
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from telegram.ext import ApplicationBuilder, CallbackQueryHandler
+
+import bot
+from config import ADMIN_ID
+from handlers.router import ACTIONS, CallbackRouter, decode, encode
+from services import sweeper
+from storage import db
+from load import StubRequest, UpdateFactory
+
+CUSTOMERS = range(100, 107)
+# Больше одной страницы в категории и в списке заказов, чтобы появились кнопки листания
+CATEGORIES = 2
+ITEMS_PER_CATEGORY = 12
+# Эти кнопки нажимает покупатель, остальные - админ
+CUSTOMER_ACTIONS = frozenset({
+    "main_menu", "catalog", "category", "item", "view_cart", "add", "clear_cart", "checkout", "confirm_payment",
+})
+
+
+class RecordingRequest(StubRequest):
+    """Заглушка Bot API из нагрузочного прогона, которая запоминает callback_data отправленных кнопок"""
+
+    def __init__(self):
+        super().__init__()
+        self.callback_data = []
+
+    async def do_request(self, url, method, request_data=None, *args, **kwargs):
+        self.callback_data.extend(collect_callback_data(request_data.parameters if request_data else {}))
+        return await super().do_request(url, method, request_data, *args, **kwargs)
+
+
+def collect_callback_data(value) -> list:
+    """Все callback_data в параметрах запроса, включая результаты inline-поиска"""
+    if isinstance(value, dict):
+        found = [value["callback_data"]] if isinstance(value.get("callback_data"), str) else []
+        for nested in value.values():
+            found.extend(collect_callback_data(nested))
+        return found
+    if isinstance(value, (list, tuple)):
+        return [data for nested in value for data in collect_callback_data(nested)]
+    return []
+
+
+def write_catalog(directory) -> None:
+    products = {"categories": [
+        {
+            "id": f"cat_{c}",
+            "name": f"Категория {c}",
+            "items": [
+                {"id": f"item_{c}_{i}", "name": f"Приказ №{c}-{i}", "price": 100 + i, "file_id": f"file_{c}_{i}"}
+                for i in range(ITEMS_PER_CATEGORY)
+            ]
+        }
+        for c in range(CATEGORIES)
+    ]}
+    os.makedirs(os.path.join(directory, 'data'))
+    with open(os.path.join(directory, 'data', 'products.json'), 'w', encoding='utf-8') as f:
+        json.dump(products, f, ensure_ascii=False)
+
+
+def find_router(application) -> CallbackRouter:
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            if isinstance(handler, CallbackQueryHandler) and isinstance(getattr(handler.callback, "__self__", None), CallbackRouter):
+                return handler.callback.__self__
+    raise AssertionError("CallbackRouter не зарегистрирован")
+
+
+async def explore(application, request: RecordingRequest) -> tuple:
+    """Обходит экраны бота; возвращает (все увиденные callback_data, ошибки обработчиков)"""
+    errors = []
+
+    async def record_error(update, context):
+        errors.append((update.callback_query.data if update and update.callback_query else update, context.error))
+
+    application.add_error_handler(record_error)
+    updates = UpdateFactory(application.bot)
+    await application.initialize()
+    try:
+        # Заказы покупателей: в панели появляются заказы, в outbox - уведомления админу
+        for user_id in CUSTOMERS:
+            for update in (
+                updates.command(user_id, "start"),
+                updates.callback(user_id, encode("add", "item_0_0")),
+                updates.callback(user_id, encode("checkout")),
+                updates.callback(user_id, encode("confirm_payment")),
+                updates.receipt(user_id),
+            ):
+                await application.process_update(update)
+        # Непустая корзина, чтобы на её экране были кнопки оформления и очистки
+        for update in (
+            updates.callback(CUSTOMERS[0], encode("add", "item_1_0")),
+            updates.command(CUSTOMERS[0], "start"),
+            updates.command(CUSTOMERS[0], "search Приказ"),
+            updates.inline(CUSTOMERS[0], "Приказ"),
+            updates.command(ADMIN_ID, "admin"),
+            updates.command(ADMIN_ID, "stats"),
+        ):
+            await application.process_update(update)
+
+        rows = await asyncio.to_thread(lambda: [row[0] for row in db.get_connection().execute("SELECT payload FROM outbox")])
+        request.callback_data.extend(data for payload in rows for data in collect_callback_data(json.loads(payload)))
+        request.callback_data.extend(collect_callback_data(sweeper._reminder([{"id": 1, "date": "", "total": 0}], 24)[2]))
+
+        # Нажимаем каждую новую кнопку
+        seen = set()
+        queue = deque()
+        while True:
+            queue.extend(request.callback_data)
+            request.callback_data.clear()
+            if not queue:
+                break
+            data = queue.popleft()
+            if data in seen:
+                continue
+            seen.add(data)
+            user_id = CUSTOMERS[0] if decode(data)[0] in CUSTOMER_ACTIONS else ADMIN_ID
+            await application.process_update(updates.callback(user_id, data))
+    finally:
+        await application.shutdown()
+    return seen, errors
+
+
+@pytest.fixture(scope="module")
+def explored(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("bot")
+    write_catalog(directory)
+    previous = os.getcwd()
+    # Хранилища бота работают с относительным каталогом data/
+    os.chdir(directory)
+    try:
+        request = RecordingRequest()
+        application = ApplicationBuilder().token("1:TEST").request(request).build()
+        bot.register_handlers(application)
+        seen, errors = asyncio.run(explore(application, request))
+    finally:
+        os.chdir(previous)
+    return application, seen, errors
+
+
+def test_every_button_routes_to_one_handler(explored):
+    application, seen, _ = explored
+    router = find_router(application)
+    problems = {data: targets for data in sorted(seen) if len(targets := router.resolve(application, data)) != 1}
+    assert not problems
+
+
+def test_buttons_fit_telegram_limit(explored):
+    _, seen, _ = explored
+    assert all(len(data.encode('utf-8')) <= 64 for data in seen)
+
+
+def test_every_action_is_reachable(explored):
+    _, seen, _ = explored
+    assert {decode(data)[0] for data in seen} == ACTIONS
+
+
+def test_buttons_are_handled_without_errors(explored):
+    _, _, errors = explored
+    assert not errors
@@ -0,0 +1,60 @@
+"""Отправляет сохранённые JSON-обновления Telegram на локальный вебхук бота.
+
+Запуск из корня проекта при UPDATE_MODE = "webhook":
+    python tools/post_update.py update.json [update2.json ...]
+
+Файл может содержать одно обновление или список обновлений.
+"""
+import json
+import os
+import ssl
+import sys
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import WEBHOOK
+
+
+def webhook_address() -> str:
+    host = WEBHOOK["listen"]
+    if host in ("0.0.0.0", "::", ""):
+        host = "127.0.0.1"
+    scheme = "https" if WEBHOOK["cert"] else "http"
+    return f"{scheme}://{host}:{WEBHOOK['port']}/{WEBHOOK['path']}"
+
+
+def post_update(update: dict) -> int:
+    request = urllib.request.Request(
+        webhook_address(),
+        data=json.dumps(update).encode('utf-8'),
+        headers={"Content-Type": "application/json"},
+        method="POST"
+    )
+    if WEBHOOK["secret_token"]:
+        request.add_header("X-Telegram-Bot-Api-Secret-Token", WEBHOOK["secret_token"])
+
+    context = None
+    if WEBHOOK["cert"]:
+        # Самоподписанный сертификат локально не проверяем
+        context = ssl.create_default_context()
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+
+    with urllib.request.urlopen(request, context=context) as response:
+        return response.status
+
+
+def main(paths: list) -> None:
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        for update in data if isinstance(data, list) else [data]:
+            status = post_update(update)
+            print(f"{path}: update_id={update.get('update_id')} -> HTTP {status}")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    main(sys.argv[1:])